@@ -0,0 +1,126 @@
+"""
+Generate synthetic nested json records for benchmarks.
+
+Knobs: record count, depth (levels of nested objects/arrays), array fanout, key width (simple keys per
+object), type heterogeneity inside arrays (simple values among objects, and arrays whose leading type
+differs as in 'tests/mock_structures.py' ArrayLeadingDiffers) and duplicate rate (records repeating an
+earlier one).
+
+Simple values are spread over the arrays of objects cumulatively (per array column, so small heterogeneity
+still gives some mixed arrays) and the first array of each column always gets one: the pandas engine fails
+on array columns whose first array holds only objects while later ones hold simple values.
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import copy
+import random
+from typing import List, Dict, Any, Tuple
+
+
+# variables
+DEFAULT_N_RECORDS = 1000
+DEFAULT_DEPTH = 2  # levels of nesting below each record
+DEFAULT_FANOUT = 3  # items per array
+DEFAULT_WIDTH = 8  # simple keys per object
+DEFAULT_HETEROGENEITY = 0.0  # share of array items that aren't objects
+DEFAULT_DUPLICATE_RATE = 0.0  # share of records repeating an earlier record
+WORDS = ["cat", "doge", "ardvark", "van halen", "hendrix", "kittens", "horses", "painting"]
+
+
+# values
+def generate_value(rng: random.Random, key_idx: int) -> Any:
+    """
+    Generate a simple value; its type depends on the key (int, float, str, bool, with some nulls) so
+    columns are mostly consistent.
+    """
+    if rng.random() < 0.05:
+        return None
+
+    kind = key_idx % 4
+    if kind == 0:
+        return rng.randrange(1_000_000)
+    if kind == 1:
+        return round(rng.uniform(-1000, 1000), 3)
+    if kind == 2:
+        return f"{rng.choice(WORDS)}_{rng.randrange(1000)}"
+
+    return rng.random() < 0.5
+
+
+def get_n_simple_items(path2carry: Dict[Tuple[str, ...], float],
+                       path: Tuple[str, ...],
+                       fanout: int,
+                       heterogeneity: float) -> int:
+    """
+    Number of simple values for the next array at this path: heterogeneity * fanout is accumulated per
+    path and the whole part is taken (the first array at a path starts with one when heterogeneity > 0).
+    """
+    carry = path2carry.get(path, 1.0 if heterogeneity > 0 else 0.0) + heterogeneity * fanout
+    n_simple_items = min(int(carry), fanout)
+    path2carry[path] = carry - n_simple_items
+
+    return n_simple_items
+
+
+def generate_object(rng: random.Random,
+                    depth: int,
+                    fanout: int,
+                    width: int,
+                    heterogeneity: float,
+                    path2carry: Dict[Tuple[str, ...], float] = None,
+                    path: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    Generate an object with width simple keys and, while depth > 0, a nested object and an array of
+    fanout items (objects, with about a heterogeneity share of simple values at random spots, see
+    get_n_simple_items()).
+
+    With probability heterogeneity it also gets an array of fanout arrays whose leading type differs
+    (a simple value and an object in either order, as in ArrayLeadingDiffers).
+    """
+    if path2carry is None:
+        path2carry = dict()
+
+    obj = {f"key_{key_idx}": generate_value(rng, key_idx) for key_idx in range(width)}
+    if depth > 0:
+        obj["child"] = generate_object(rng, depth - 1, fanout, width, heterogeneity, path2carry,
+                                       path + ("child",))
+
+        # item spots are drawn first so objects are generated in array order
+        n_simple_items = get_n_simple_items(path2carry, path + ("items",), fanout, heterogeneity)
+        is_simple = [True] * n_simple_items + [False] * (fanout - n_simple_items)
+        rng.shuffle(is_simple)
+        obj["items"] = [generate_value(rng, 2) if simple
+                        else generate_object(rng, depth - 1, fanout, width, heterogeneity, path2carry,
+                                             path + ("items",))
+                        for simple in is_simple]
+        if rng.random() < heterogeneity:
+            obj["mixed"] = [rng.sample([generate_value(rng, 0), generate_object(rng, 0, fanout, width, 0)], 2)
+                            for _ in range(fanout)]
+
+    return obj
+
+
+# records
+def generate_records(n_records: int = DEFAULT_N_RECORDS,
+                     depth: int = DEFAULT_DEPTH,
+                     fanout: int = DEFAULT_FANOUT,
+                     width: int = DEFAULT_WIDTH,
+                     heterogeneity: float = DEFAULT_HETEROGENEITY,
+                     duplicate_rate: float = DEFAULT_DUPLICATE_RATE,
+                     seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Generate json records (the same records for the same arguments).
+    """
+    rng = random.Random(seed)
+    path2carry = dict()
+    records = list()
+    for record_idx in range(n_records):
+        if record_idx > 0 and rng.random() < duplicate_rate:
+            records.append(copy.deepcopy(records[rng.randrange(record_idx)]))
+        else:
+            records.append(generate_object(rng, depth, fanout, width, heterogeneity, path2carry))
+
+    return records
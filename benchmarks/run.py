@@ -0,0 +1,379 @@
+"""
+benchmark suite
+
+Times breakdown_json() and merge_tables() on synthetic records ('generate.py'): a base scenario plus
+sweeps varying one knob at a time. Each scenario reports seconds and records/sec per stage, and results
+are saved as json (in 'results/' next to this file by default) so runs can be compared.
+
+With --memory each scenario instead runs at a few sizes, each stage in a fresh subprocess, recording peak
+RSS and the tracemalloc peak (also per input record) and flagging stages whose memory grows faster than
+linearly with the number of records.
+
+to run benchmarks enter `python run.py [--quick] [--memory] [--engine native] [--output FILE] [--compare OLD_FILE]`
+in shell
+"""
+
+# standard
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tracemalloc
+import subprocess
+from typing import List, Dict, Any, TypeVar, Tuple, Callable
+
+# data science
+import numpy as np
+import pandas as pd
+
+# module
+import generate
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src/"))
+import breakdown, merge, profiler
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+BASE_SCENARIO = {"n_records": 2000,
+                 "depth": generate.DEFAULT_DEPTH,
+                 "fanout": generate.DEFAULT_FANOUT,
+                 "width": generate.DEFAULT_WIDTH,
+                 "heterogeneity": generate.DEFAULT_HETEROGENEITY,
+                 "duplicate_rate": generate.DEFAULT_DUPLICATE_RATE}
+SWEEPS = {"n_records": [500, 2000, 8000],
+          "depth": [1, 2, 3],
+          "fanout": [1, 3, 6],
+          "width": [4, 8, 32],
+          "heterogeneity": [0.0, 0.25, 0.5],
+          "duplicate_rate": [0.0, 0.5, 0.9]}
+QUICK_RECORD_SCALE = 0.1  # share of the records generated with --quick
+STAGES = ["breakdown", "merge"]
+MEMORY_STAGES = ["breakdown", "merge", "profile"]
+MEMORY_SCALES = [1, 2, 4]  # record counts (relative to a scenario's) memory is measured at
+MAX_LINEAR_EXPONENT = 1.2  # memory growing as n_records ** exponent above this is flagged as superlinear
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")  # default output directory
+
+
+# scenarios
+def get_scenario_name(scenario: Dict[str, Any]) -> str:
+    """
+    Name a scenario by the knobs where it differs from the base scenario and its record count
+    (e.g. 'depth=3@2000').
+    """
+    changes = [f"{knob}={value}" for knob, value in scenario.items()
+               if knob != "n_records" and value != BASE_SCENARIO[knob]]
+
+    return f"{','.join(changes) or 'base'}@{scenario['n_records']}"
+
+
+def get_scenarios(quick: bool = False) -> List[Dict[str, Any]]:
+    """
+    Get the base scenario and the sweeps of each knob (each scenario once).
+    """
+    scenarios = [dict(BASE_SCENARIO)]
+    for knob, values in SWEEPS.items():
+        for value in values:
+            scenario = {**BASE_SCENARIO, knob: value}
+            if scenario not in scenarios:
+                scenarios.append(scenario)
+
+    if quick:
+        for scenario in scenarios:
+            scenario["n_records"] = max(1, round(scenario["n_records"] * QUICK_RECORD_SCALE))
+
+    return scenarios
+
+
+# timing
+def time_stage(func: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """
+    Get the best time (in seconds) of repeated calls and the result of the last call.
+    """
+    best_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+
+    return best_seconds, result
+
+
+def run_scenario(scenario: Dict[str, Any],
+                 engine: str = "pandas",
+                 repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time each stage over the records of a scenario.
+    """
+    records = generate.generate_records(**scenario)
+    breakdown_seconds, tag2df = time_stage(
+        lambda: breakdown.breakdown_json(records, engine=engine), repeat)
+    merge_seconds, merged_tag2df = time_stage(
+        lambda: merge.merge_tables(tag2df, verbose=False), repeat)
+
+    stage2seconds = {"breakdown": breakdown_seconds, "merge": merge_seconds}
+    return {"name": get_scenario_name(scenario),
+            "scenario": scenario,
+            "n_tables": len(tag2df),
+            "n_rows": int(sum(len(df) for df in tag2df.values())),
+            "n_merged_rows": int(sum(len(df) for df in merged_tag2df.values())),
+            "stages": {stage: {"seconds": seconds,
+                               "records_per_sec": len(records) / seconds if seconds > 0 else None}
+                       for stage, seconds in stage2seconds.items()},
+            "total_seconds": sum(stage2seconds.values())}
+
+
+def get_environment() -> Dict[str, Any]:
+    """
+    Describe where the benchmarks ran (versions, machine and git commit).
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:  # git isn't installed
+        commit = ""
+
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+
+# comparing runs
+def compare_results(old_results: Dict[str, Any], new_results: Dict[str, Any]) -> PandasDataFrame:
+    """
+    Compare the stage times of the scenarios in two runs (speedup > 1 means the new run is faster).
+    """
+    name2old_result = {result["name"]: result for result in old_results["results"]}
+    rows = list()
+    for result in new_results["results"]:
+        old_result = name2old_result.get(result["name"])
+        if old_result is None or old_result["scenario"] != result["scenario"]:
+            continue
+        for stage in STAGES:
+            old_seconds, new_seconds = (old_result["stages"][stage]["seconds"],
+                                        result["stages"][stage]["seconds"])
+            rows.append({"name": result["name"],
+                         "stage": stage,
+                         "old_seconds": old_seconds,
+                         "new_seconds": new_seconds,
+                         "speedup": old_seconds / new_seconds if new_seconds > 0 else None})
+
+    return pd.DataFrame(rows, columns=["name", "stage", "old_seconds", "new_seconds", "speedup"])
+
+
+def summarize_results(results: Dict[str, Any]) -> PandasDataFrame:
+    """
+    Tabulate records/sec and seconds per stage of each scenario.
+    """
+    rows = list()
+    for result in results["results"]:
+        row = {"name": result["name"], "n_records": result["scenario"]["n_records"],
+               "n_tables": result["n_tables"]}
+        for stage in STAGES:
+            row[f"{stage}_seconds"] = result["stages"][stage]["seconds"]
+            row[f"{stage}_records_per_sec"] = result["stages"][stage]["records_per_sec"]
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index("name")
+
+
+# memory
+def get_rss(field: str = "VmRSS") -> int:
+    """
+    Get the resident set size of this process in bytes ('VmRSS'), or its peak ('VmHWM'), from
+    /proc/self/status (falling back to the peak from getrusage() where there's no /proc).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:  # not linux
+        pass
+
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset this process's peak resident set size to its current size (linux only).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_stage(stage: str, records: List[Dict[str, Any]], engine: str) -> Callable[[], Any]:
+    """
+    Get a stage to measure over records (inputs of the stage are prepared beforehand).
+    """
+    if stage == "breakdown":
+        return lambda: breakdown.breakdown_json(records, engine=engine)
+    if stage == "merge":
+        tag2df = breakdown.breakdown_json(records, engine=engine)
+        return lambda: merge.merge_tables(tag2df, verbose=False)
+    if stage == "profile":
+        return lambda: profiler.profile_records(records)
+
+    raise ValueError(f"Unknown stage '{stage}', expected one of {MEMORY_STAGES}.")
+
+
+def measure_stage_memory(scenario: Dict[str, Any], stage: str, engine: str = "pandas") -> Dict[str, Any]:
+    """
+    Measure the memory of a stage over the records of a scenario (meant to run in a fresh process).
+
+    The stage runs once for the peak RSS, then again under tracemalloc (which slows it down and
+    adds to RSS) for the peak of memory allocated by the stage itself.
+    """
+    records = generate.generate_records(**scenario)
+    run_stage = get_stage(stage, records, engine)
+    gc.collect()
+
+    rss_before = get_rss()
+    peak_reset = reset_peak_rss()
+    result = run_stage()
+    peak_rss = get_rss("VmHWM")
+    del result
+    gc.collect()
+
+    tracemalloc.start()
+    result = run_stage()
+    tracemalloc_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"n_records": len(records),
+            "rss_before": rss_before,
+            "peak_rss": peak_rss,
+            "peak_rss_increase": max(0, peak_rss - rss_before),
+            "peak_rss_reset": peak_reset,
+            "tracemalloc_peak": tracemalloc_peak}
+
+
+def measure_stage_memory_in_subprocess(scenario: Dict[str, Any],
+                                       stage: str,
+                                       engine: str = "pandas") -> Dict[str, Any]:
+    """
+    Measure the memory of a stage (see measure_stage_memory()) in a fresh python process, so earlier
+    runs don't leave their peak or their freed memory behind.
+    """
+    job = json.dumps({"scenario": scenario, "stage": stage, "engine": engine})
+    process = subprocess.run([sys.executable, "-W", "ignore", os.path.abspath(__file__), "--memory-job", job],
+                             capture_output=True, text=True, check=True)
+
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def get_growth_exponent(n_records: List[int], n_bytes: List[int]) -> float:
+    """
+    Get the exponent of memory growth with the number of records (slope of a log-log fit, 1 is linear).
+    """
+    if len(set(n_records)) < 2 or min(n_bytes) <= 0:
+        return None
+
+    return float(np.polyfit(np.log(n_records), np.log(n_bytes), 1)[0])
+
+
+def run_memory_scenario(scenario: Dict[str, Any], engine: str = "pandas") -> Dict[str, Any]:
+    """
+    Measure the memory of each stage of a scenario at each of MEMORY_SCALES, and how it grows.
+    """
+    stages = dict()
+    for stage in MEMORY_STAGES:
+        sizes = list()
+        for scale in MEMORY_SCALES:
+            sized_scenario = {**scenario, "n_records": max(1, round(scenario["n_records"] * scale))}
+            size = measure_stage_memory_in_subprocess(sized_scenario, stage, engine)
+            size["rss_bytes_per_record"] = size["peak_rss_increase"] / size["n_records"]
+            size["tracemalloc_bytes_per_record"] = size["tracemalloc_peak"] / size["n_records"]
+            sizes.append(size)
+
+        exponent = get_growth_exponent([size["n_records"] for size in sizes],
+                                       [size["tracemalloc_peak"] for size in sizes])
+        stages[stage] = {"sizes": sizes,
+                         "growth_exponent": exponent,
+                         "superlinear": exponent is not None and exponent > MAX_LINEAR_EXPONENT}
+
+    return {"name": get_scenario_name(scenario), "scenario": scenario, "stages": stages}
+
+
+def summarize_memory_results(results: Dict[str, Any]) -> PandasDataFrame:
+    """
+    Tabulate the memory of each stage of each scenario at its largest size, and how it grows.
+    """
+    rows = list()
+    for result in results["results"]:
+        for stage, stage_result in result["stages"].items():
+            largest_size = stage_result["sizes"][-1]
+            rows.append({"name": result["name"],
+                         "stage": stage,
+                         "n_records": largest_size["n_records"],
+                         "peak_rss_mb": largest_size["peak_rss"] / 1024 ** 2,
+                         "rss_bytes_per_record": largest_size["rss_bytes_per_record"],
+                         "tracemalloc_bytes_per_record": largest_size["tracemalloc_bytes_per_record"],
+                         "growth_exponent": stage_result["growth_exponent"],
+                         "superlinear": stage_result["superlinear"]})
+
+    return pd.DataFrame(rows).set_index(["name", "stage"])
+
+
+# main
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--quick", action="store_true", help="run each scenario on a tenth of the records")
+    parser.add_argument("--memory", action="store_true", help="measure peak memory instead of throughput")
+    parser.add_argument("--engine", default="pandas", help="breakdown engine ('pandas', 'native' or 'arrow')")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (the best time is kept)")
+    parser.add_argument("--output", default=None,
+                        help="file the results are saved to (default 'results/throughput.json' or "
+                             "'results/memory.json' next to this file)")
+    parser.add_argument("--compare", default=None, help="throughput results of an earlier run to compare against")
+    parser.add_argument("--memory-job", default=None, help=argparse.SUPPRESS)  # a subprocess of --memory
+    options = parser.parse_args(args)
+
+    if options.memory_job is not None:
+        job = json.loads(options.memory_job)
+        print(json.dumps(measure_stage_memory(job["scenario"], job["stage"], job["engine"])))
+        return
+
+    results = {"environment": {**get_environment(), "engine": options.engine, "repeat": options.repeat},
+               "results": list()}
+    for scenario in get_scenarios(options.quick):
+        if options.memory:
+            results["results"].append(run_memory_scenario(scenario, options.engine))
+            flagged_stages = [stage for stage, stage_result in results["results"][-1]["stages"].items()
+                              if stage_result["superlinear"]]
+            print(f"{results['results'][-1]['name']}: superlinear stages {flagged_stages}", flush=True)
+        else:
+            results["results"].append(run_scenario(scenario, options.engine, options.repeat))
+            print(f"{results['results'][-1]['name']}: {results['results'][-1]['total_seconds']:.3f}s", flush=True)
+
+    output = options.output or os.path.join(RESULTS_DIR, "memory.json" if options.memory else "throughput.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        if options.memory:
+            print(summarize_memory_results(results))
+        else:
+            print(summarize_results(results))
+        if options.compare is not None and not options.memory:
+            with open(options.compare) as f:
+                print(compare_results(json.load(f), results))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,8 +18,8 @@ from typing import Union, List, Dict, Any, Tuple
 
 
 def compile_nested_keys(data:Union[Dict[str, Any], List[Any]], 
-                        level2keys:Dict[str, List[str]]=dict(), 
-                        key2value_list:Dict[str, List[Any]]=dict(), 
+                        level2keys:Dict[str, List[str]]=None, 
+                        key2value_list:Dict[str, List[Any]]=None, 
                         level=0, current_parent="ROOT") -> Tuple[List[str], Dict[str, List[str]], Dict[str, List[Any]]]:
     """
     generates a list of data keys and organizes the keys by index level in the data 
@@ -27,7 +27,12 @@ def compile_nested_keys(data:Union[Dict[str, Any], List[Any]],
     as this is intended for json data, only lists and dicts are considered valid substructures
 
     the key2value_list only maps a key to individual specific values; not to subkeys
+    (it keeps every value, see 'src/profiler.py' for a bounded-memory profile of large streams)
     """
+    # fresh mappings per top-level call (mutable defaults would be shared between calls)
+    level2keys = dict() if level2keys is None else level2keys
+    key2value_list = dict() if key2value_list is None else key2value_list
+
     if isinstance(data, dict): # if the data is a dictionary, save the keys
         level2keys[level] = [key.lower() for key in list(data.keys())] 
         
@@ -206,6 +211,9 @@ def compile_nested_keys(data:Union[Dict[str, Any], List[Any]],
 #     return attribute2tally
 
 
+# the per-document trees below (IterateDataNodes/MergeFileTrees/CompileTreeStructure) are superseded by
+# 'src/profiler.py': profile_directory() profiles files in parallel and key_tree() gives the merged tree
+
 # def IterateDataNodes(key2children_chain, data):
 #     """
 #     Function iterates through the nodes of a data file and compiles a tree structure for the data. 
@@ -12,13 +12,27 @@ Assumes the four JSON rules:
 
 
 # standard
-import json
+import warnings
+import functools
+from concurrent.futures import ProcessPoolExecutor
 from IPython.display import display
-from typing import Union, List, Dict, Any, TypeVar, Tuple
+from collections.abc import Mapping
+from typing import Union, List, Dict, Any, TypeVar, Tuple, Set, Iterable, Iterator, Callable
 
 # data science
 import numpy as np
 import pandas as pd
+try:  # optional dependency (arrow engine)
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# module
+try:  # imported as part of the package
+    from . import dedup
+except ImportError:  # imported with 'src/' on the path (e.g. tests)
+    import dedup
 
 
 # configurations
@@ -28,6 +42,14 @@ pd.options.mode.chained_assignment = None
 # variables
 PandasDataFrame = TypeVar("pd.DataFrame")
 DEBUG = False  # set to True for steps taken to break down data
+DEFAULT_CATEGORY_RATIO = 0.5  # most distinct values (per row) for a string column to become categorical
+MAX_SHAPE_RECORD_SHARE = 0.5  # most shape records (per shard record) for a parallel breakdown to use workers
+
+
+class EngineFallbackWarning(UserWarning):
+    """
+    Warning that the arrow engine was asked for but the records were broken down with the native engine.
+    """
 
 
 # breaking down json into atomic tables
@@ -118,50 +140,79 @@ def rename_expanded_array_cols(
     return df
 
 
-def get_cols_with_vals_of_types(
-        df: PandasDataFrame,
-        types: List[str]) -> List[str]:
+def take_type_census(values: Iterable[Any]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
     """
-    Figure out what columns contain values of certain types (will be broken up).
+    Single pass over a column's values giving a compact type code per cell and the positions of each type.
 
-    Columns returned contained at least one value that is of at least one of the specified types.
+    Type codes (and the positions mapping) follow the order types first appear in.
     """
-    cols_to_breakdown = list()
-    for col in list(df):
-        # if any values in column are of this type, need to breakdown feature
-        if any([str(type_) in {str(type(v))
-               for v in df[col]} for type_ in types]):
-            cols_to_breakdown.append(col)
+    if getattr(values, "dtype", np.dtype(object)).kind in "biuf" and len(values) > 0:
+        # numeric/boolean columns hold a single python type
+        codes, types = np.zeros(len(values), dtype=np.int64), [type(next(iter(values)))]
+    else:
+        type2code = dict()
+        codes = np.fromiter((type2code.setdefault(type_, len(type2code))
+                             for type_ in map(type, values)), dtype=np.int64)
+        types = list(type2code)
 
-    return cols_to_breakdown
+    type2idxs = {str(type_): np.flatnonzero(codes == code)
+                 for code, type_ in enumerate(types)}
 
+    return codes.astype(np.min_scalar_type(max(len(types) - 1, 0))), type2idxs
 
-def update_breakdown_cols(type2cols_to_breakdown: Dict[str,
-                                                       List[str]],
-                          df: PandasDataFrame) -> Tuple[bool,
-                                                        Dict[str,
-                                                             List[str]]]:
+
+def take_frame_type_census(df: PandasDataFrame,
+                           cols: List[str] = None) -> Dict[str, Tuple[np.ndarray,
+                                                                      Dict[str, np.ndarray]]]:
     """
-    Check for additional columns to breakdown after first breakdown.
+    Take the type census of (some of) the columns of a dataframe.
     """
-    for type_ in type2cols_to_breakdown:
-        type2cols_to_breakdown[type_].extend(get_cols_with_vals_of_types(
-            df, [type_]))  # the previously expanded column dataframe
+    return {col: take_type_census(df[col])
+            for col in (list(df) if cols is None else cols)}
 
-    return type2cols_to_breakdown
+
+def update_type_census(col2census: Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]],
+                       df: PandasDataFrame,
+                       new_cols: List[str]) -> Dict[str, Tuple[np.ndarray,
+                                                               Dict[str, np.ndarray]]]:
+    """
+    Update the cached census for a frame after columns were merged in (dropping removed columns).
+
+    Returns the census of the new columns only.
+    """
+    for col in [col for col in col2census if col not in list(df)]:
+        del col2census[col]
+
+    new_col2census = take_frame_type_census(
+        df, [col for col in list(df) if col in new_cols or col not in col2census])
+    col2census.update(new_col2census)
+
+    return new_col2census
 
 
-def get_cell_datatypes_by_index(
-        df: PandasDataFrame, col_to_break: str) -> Tuple[Dict[int, str], Dict[str, List[int]]]:
+def get_cols_with_census_types(col2census: Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]],
+                               types: List[type]) -> List[str]:
     """
-    Generate a mapping/reverse mapping of indices to cell value type.
+    Figure out what columns (of a census) contain values of certain types.
     """
-    idx2type = {idx: str(type(value))
-                for idx, value in df[col_to_break].items()}
-    type2idxs = {type_: [idx for idx in idx2type if idx2type[idx] == type_]
-                 for type_ in idx2type.values()}
+    return [col for col, (_, type2idxs) in col2census.items()
+            if any([str(type_) in type2idxs for type_ in types])]
 
-    return idx2type, type2idxs
+
+def update_breakdown_cols(type2cols_to_breakdown: Dict[str,
+                                                       List[str]],
+                          new_col2census: Dict[str, Tuple[np.ndarray,
+                                                          Dict[str, np.ndarray]]]) -> Dict[str,
+                                                                                           List[str]]:
+    """
+    Check for additional columns to breakdown after first breakdown.
+    """
+    for type_ in type2cols_to_breakdown:
+        type2cols_to_breakdown[type_].extend([
+            col for col, (_, type2idxs) in new_col2census.items()
+            if type_ in type2idxs])  # the columns from the previously expanded column dataframe
+
+    return type2cols_to_breakdown
 
 
 def process_expanded_column_child_table(
@@ -213,11 +264,13 @@ def process_expanded_column_object_only_table(
 def process_final_table(
         df: PandasDataFrame,
         current_pk_col: str,
-        current_df_tag: str) -> PandasDataFrame:
+        current_df_tag: str,
+        typed: bool = False) -> PandasDataFrame:
     """
     final processing of fully expanded data table
 
     completely empty columns are not dropped (in case there will be data there in the future)
+    when typed, missing values stay null and columns get pandas' nullable dtypes instead of being filled with ""
     """
     # renames
     df.rename({current_pk_col: "PK"}, axis=1, inplace=True)
@@ -226,7 +279,10 @@ def process_final_table(
     idx_cols = [c for c in ["PK", "FK", "subarray_IDX"] if c in list(df)]
     df = df[idx_cols + [c for c in list(df) if c not in idx_cols]]
 
-    df.fillna("", inplace=True)
+    if typed:
+        df = df.convert_dtypes()
+    else:
+        df.fillna("", inplace=True)
 
     # add parent frame tags
     parent_df_tag = "_".join(current_df_tag.split("<")[-1].split("_")[:-1])
@@ -240,8 +296,11 @@ def process_final_table(
             "FK"] else str(c) for c in list(df)]
 
     # dropping duplicates; this is done including PK/FK to avoid leaving out
-    # data matches during merging
-    df.drop_duplicates(inplace=True)
+    # data matches during merging (a unique PK rules duplicates out, otherwise
+    # rows are compared by their hashes)
+    duplicated = dedup.get_duplicated_rows(df, ["PK"])
+    if duplicated.any():
+        df = df[~duplicated]
 
     # tidy
     df.reset_index(drop=True, inplace=True)
@@ -267,18 +326,21 @@ def add_frame_to_breakdown_queue(
 def breakdown_single_column(
         df: PandasDataFrame,
         col_to_break: str,
-        current_pk_col: str) -> PandasDataFrame:
+        current_pk_col: str,
+        type2idxs: Dict[str, np.ndarray] = None) -> PandasDataFrame:
     """
     Breakdown cell values in a single column.
 
-    To do this the values in this column are sorted by value type.
+    To do this the values in this column are sorted by value type (positions by type can be passed from a
+    cached census).
     This is to avoid breaking down items that aren't meant to be broken up (e.g.
     dont want 'abc' ---> 'a' 'b' 'c') and to avoid json_normalize() errors.
     """
     df = df[[col_to_break, current_pk_col]]  # don't duplicate other columns
 
     # methodology differs slightly depending on datatype in cell
-    idx2type, type2idxs = get_cell_datatypes_by_index(df, col_to_break)
+    if type2idxs is None:
+        _, type2idxs = take_type_census(df[col_to_break])
 
     # reorder array items to avoid json_normalize() errors
     if "<class 'list'>" in type2idxs:
@@ -299,16 +361,27 @@ def breakdown_single_column(
                 non_breakdown_idxs.extend(idxs)
 
         else:  # this is a cell to breakdown
-            normed_json = json.loads(df.iloc[idxs].to_json(orient="records"))
+            # the cell objects are used as is (no serialization so values
+            # keep their types/precision), only missing values become None
+            # as in JSON so the key columns keep their dtypes
+            records = [missing_to_none(record)
+                       for record in df.iloc[idxs].to_dict(orient="records")]
 
             if type_ == "<class 'dict'>":
-                # dicts to breakdown so dont provide record_path (want separate
-                # cols and not rows for each key)
-                expanded_type_df = pd.json_normalize(
-                    data=normed_json, meta=current_pk_col)
+                # dicts to breakdown so want separate cols and not rows for
+                # each key (flattened as json_normalize() would without a
+                # record_path)
+                expanded_type_df = pd.DataFrame(
+                    [flatten_record(record) for record in records])
 
             elif type_ == "<class 'list'>":
-                expanded_type_df = pd.json_normalize(data=normed_json,
+                # objects in arrays are flattened up front (json_normalize()
+                # can't flatten non-string keys)
+                for record in records:
+                    record[col_to_break] = [flatten_record(val) if isinstance(
+                        val, dict) else val for val in record[col_to_break]]
+
+                expanded_type_df = pd.json_normalize(data=records,
 
                                                      # only breakdown this
                                                      # column
@@ -417,19 +490,20 @@ def breakdown_columns(df: PandasDataFrame,
         print(f"new parent df with tag {current_df_tag}:")
         display(df.head(3))
 
+    # type census of each column (kept up to date as columns are
+    # merged/dropped)
+    col2census = take_frame_type_census(df)
     type2cols_to_breakdown = {
-        str(type_): get_cols_with_vals_of_types(df, [type_])
+        str(type_): get_cols_with_census_types(col2census, [type_])
         for type_ in [dict, list]}
 
-    idx = 0
-    last_expanded_object, expanded_col_df = False, None
+    last_expanded_object, new_col2census = False, None
     while True:  # still columns to breakdown
-        idx += 1
         # if last item expanded was an object, make sure no new cols of concern
         # were merged back into frame
-        if last_expanded_object:  # only pass expanded col df since this will be trimmed to the new columns in the parent frame
+        if last_expanded_object:  # only pass census of the new columns in the parent frame
             type2cols_to_breakdown = update_breakdown_cols(
-                type2cols_to_breakdown, expanded_col_df)
+                type2cols_to_breakdown, new_col2census)
 
         # get the next column to breakdown
         try:
@@ -442,19 +516,23 @@ def breakdown_columns(df: PandasDataFrame,
             break  # all done with this data frame
 
         expanded_col_df = breakdown_single_column(
-            df, col_to_break, current_pk_col)
+            df, col_to_break, current_pk_col, col2census[col_to_break][1])
 
         # if col had only subdictionaries, merge broken frame back into parent
         if col_to_break not in type2cols_to_breakdown["<class 'list'>"]:
             expanded_col_df, df = post_object_only_expansion(
                 col_to_break, current_pk_col, drop_empty,
                 type2cols_to_breakdown, df, expanded_col_df)
+            new_col2census = update_type_census(
+                col2census, df, [col for col in list(expanded_col_df)
+                                 if col != current_pk_col])
             last_expanded_object = True
 
         else:  # if at least one cell in col had a subarray, make new child table
             df, expanded_col_df, table_tag2df = post_array_expansion(
                 current_pk_col, col_to_break, current_level, current_df_tag,
                 expanded_col_df, df, drop_empty, table_tag2df)
+            del col2census[col_to_break]
             last_expanded_object = False
 
         # remove col from breakdown list
@@ -463,15 +541,1320 @@ def breakdown_columns(df: PandasDataFrame,
     return df, table_tag2df
 
 
+# native tree-walking engine (mirrors the json_normalize() based loop above
+# without building intermediate dataframes)
+def is_null_value(value: Any) -> bool:
+    """
+    Check if a cell value counts as missing (None or NaN).
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def flatten_nested_value(value: Dict[str, Any],
+                         prefix: str,
+                         keep_col: Callable[[str], bool] = None) -> Dict[str, Any]:
+    """
+    Flatten a (sub)dictionary below a key, joining nested keys with '.'.
+
+    Empty dictionaries leave no keys behind (as with json_normalize()). Keys failing keep_col (if given)
+    are skipped along with everything below them.
+    """
+    flattened = dict()
+    for key, subvalue in value.items():
+        flat_key = prefix + "." + str(key)
+        if keep_col is not None and not keep_col(flat_key):
+            continue
+        if isinstance(subvalue, dict):
+            flattened.update(flatten_nested_value(subvalue, flat_key, keep_col))
+        else:
+            flattened[flat_key] = subvalue
+
+    return flattened
+
+
+def missing_to_none(value: Any) -> Any:
+    """
+    Replace float NaNs nested in a cell value by None (as a JSON round trip would, keeping the frame dtypes).
+    """
+    if isinstance(value, dict):
+        return {key: missing_to_none(subvalue) for key, subvalue in value.items()}
+    if isinstance(value, list):
+        return [missing_to_none(subvalue) for subvalue in value]
+    if isinstance(value, float) and value != value:
+        return None
+
+    return value
+
+
+def flatten_record(record: Dict[str, Any],
+                   keep_col: Callable[[str], bool] = None) -> Dict[str, Any]:
+    """
+    Flatten a top level record, keeping non-object keys in place and appending expanded objects.
+    """
+    flattened = {str(key): value for key, value in record.items()
+                 if not isinstance(value, dict) and (keep_col is None or keep_col(str(key)))}
+    for key, value in record.items():
+        if isinstance(value, dict) and (keep_col is None or keep_col(str(key))):
+            flattened.update(flatten_nested_value(value, str(key), keep_col))
+
+    return flattened
+
+
+def get_value_positions_by_type(values: List[Any]) -> Dict[type, List[int]]:
+    """
+    Group row positions by cell value type (in order of first appearance).
+    """
+    type2positions = dict()
+    for position, value in enumerate(values):
+        type2positions.setdefault(type(value), []).append(position)
+
+    return type2positions
+
+
+def rows_to_buffers(rows: List[Dict[str, Any]],
+                    missing: Any = np.nan) -> Dict[str, List[Any]]:
+    """
+    Convert a list of row dictionaries into column buffers (columns in order of first appearance).
+    """
+    columns = dict()
+    for row in rows:
+        for col in row:
+            columns[col] = None
+
+    return {col: [row.get(col, missing) for row in rows] for col in columns}
+
+
+def fill_child_buffer(values: List[Any]) -> List[Any]:
+    """
+    Replace missing values with "" after casting numeric values as pandas would (ints become floats
+    once a column has missing values or floats).
+    """
+    missing = [is_null_value(v) for v in values]
+    present_types = {type(v) for v, null in zip(values, missing) if not null}
+    if present_types and present_types <= {int, float} and (
+            any(missing) or float in present_types):
+        return [float(v) if not null else "" for v, null in zip(values, missing)]
+
+    return [v if not null else "" for v, null in zip(values, missing)]
+
+
+def drop_empty_buffers(buffers: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    """
+    Drop columns without any data (None is treated as NaN as with the pandas engine).
+    """
+    buffers = {col: [np.nan if v is None else v for v in values]
+               for col, values in buffers.items()}
+
+    return {col: values for col, values in buffers.items()
+            if not all(is_null_value(v) for v in values)}
+
+
+def walk_list_records(values: List[Any],
+                      positions: List[int],
+                      col_to_break: str,
+                      current_pk_col: str,
+                      keep_col: Callable[[str], bool] = None) -> List[Dict[str, Any]]:
+    """
+    Build child rows from every item of the list cells at the given positions.
+
+    The layout of the rows follows the first item, as json_normalize() does: objects become columns,
+    arrays become indexed columns and anything else stays in a single column named after the parent.
+    """
+    records, owners = list(), list()
+    for position in positions:
+        for item in values[position]:
+            records.append(
+                flatten_record(item, keep_col) if isinstance(
+                    item, dict) else item)
+            owners.append(position)
+
+    if len(records) == 0:
+        return list()
+
+    if all(isinstance(record, dict) for record in records):
+        rows = [dict(record) for record in records]
+
+    elif isinstance(records[0], list):
+        # array items are spread over one column per index
+        items = [list(record) if isinstance(record, (list, str, dict))
+                 else [record] for record in records]
+        width = max([len(item) for item in items])
+        names = [col_to_break + f"_idx_{num}" for num in range(width)
+                 ] if width > 1 else [col_to_break] * width
+        rows = [dict(zip(names, item + [None] * (width - len(item))))
+                for item in items]
+
+    else:  # simple values (any objects/arrays stay as cell values)
+        rows = [{col_to_break: record} for record in records]
+
+    for row, owner in zip(rows, owners):
+        row[current_pk_col] = owner
+        row["subarray_IDX"] = np.nan
+
+    return rows
+
+
+def walk_array_column(values: List[Any],
+                      col_to_break: str,
+                      current_pk_col: str,
+                      drop_empty: bool,
+                      keep_col: Callable[[str], bool] = None,
+                      typed: bool = False,
+                      row_types: List[str] = None) -> Tuple[Dict[str, List[Any]], int]:
+    """
+    Expand a column with at least one array into the column buffers of a child table (and its row count).
+
+    Object keys failing the child table's keep_col (if given) are never expanded. Missing values are
+    filled with "" (as the pandas engine does) unless typed. Given row_types, the type of the cell each
+    row comes from is appended to it (rows are grouped by it).
+    """
+    values = reorder_cell_array_values(values)
+
+    # expanded rows come first (by type), then the simple values left alone
+    expanded_rows, non_breakdown_rows = list(), list()
+    expanded_types, non_breakdown_types = list(), list()
+    for type_, positions in get_value_positions_by_type(values).items():
+        n_expanded_rows, n_non_breakdown_rows = len(expanded_rows), len(non_breakdown_rows)
+        if issubclass(type_, dict):
+            expanded_rows.extend([{current_pk_col: position,
+                                   **flatten_nested_value(values[position], col_to_break, keep_col)}
+                                  for position in positions])
+        elif issubclass(type_, list):
+            expanded_rows.extend(walk_list_records(
+                values, positions, col_to_break, current_pk_col, keep_col))
+        elif not all(is_null_value(values[position]) for position in positions):
+            non_breakdown_rows.extend([{col_to_break: values[position],
+                                        current_pk_col: position}
+                                       for position in positions])
+        expanded_types.extend([type_.__name__] * (len(expanded_rows) - n_expanded_rows))
+        non_breakdown_types.extend([type_.__name__] * (len(non_breakdown_rows) - n_non_breakdown_rows))
+
+    rows = expanded_rows + non_breakdown_rows
+    if row_types is not None:
+        row_types.extend(expanded_types + non_breakdown_types)
+    buffers = rows_to_buffers(rows)
+    if len(rows) == 0:
+        buffers = {current_pk_col: [], "subarray_IDX": []}
+
+    # subarray index resets at each parent PK value
+    pk2count, subarray_idxs = dict(), list()
+    for pk in buffers[current_pk_col]:
+        subarray_idxs.append(pk2count.get(pk, 0))
+        pk2count[pk] = subarray_idxs[-1] + 1
+    buffers["subarray_IDX"] = subarray_idxs
+
+    buffers = {"FK" if col == current_pk_col else col: col_values
+               for col, col_values in buffers.items()}
+    if drop_empty:
+        buffers = drop_empty_buffers(buffers)
+    if typed:
+        return buffers, len(rows)
+
+    return {col: fill_child_buffer(col_values)
+            for col, col_values in buffers.items()}, len(rows)
+
+
+def walk_object_column(table: Dict[str, List[Any]],
+                       col_to_break: str,
+                       current_pk_col: str,
+                       drop_empty: bool,
+                       keep_col: Callable[[str], bool] = None) -> Tuple[Dict[str, List[Any]],
+                                                                        Dict[str, List[Any]]]:
+    """
+    Expand a column holding objects (and simple values) into columns of its own table.
+
+    Returns the updated table and the expanded columns (to check for more columns to breakdown).
+    Object keys failing keep_col (if given) are never expanded.
+    """
+    values = table[col_to_break]
+
+    expanded_rows, non_breakdown_rows = list(), list()
+    for type_, positions in get_value_positions_by_type(values).items():
+        if issubclass(type_, dict):
+            expanded_rows.extend([{current_pk_col: position,
+                                   **flatten_nested_value(values[position], col_to_break, keep_col)}
+                                  for position in positions])
+        elif not all(is_null_value(values[position]) for position in positions):
+            non_breakdown_rows.extend([{col_to_break: values[position],
+                                        current_pk_col: position}
+                                       for position in positions])
+
+    expanded_buffers = rows_to_buffers(expanded_rows + non_breakdown_rows)
+    if drop_empty:
+        expanded_buffers = drop_empty_buffers(expanded_buffers)
+
+    # left merge on the primary key (rows without expanded values get NaN)
+    n_rows = len(table[current_pk_col])
+    expanded_pks = expanded_buffers[current_pk_col]
+    new_cols = [col for col in expanded_buffers if col != current_pk_col]
+    table = {col: col_values for col, col_values in table.items()
+             if col != col_to_break}
+    for col in new_cols:
+        merged_values = [np.nan] * n_rows
+        for pk, value in zip(expanded_pks, expanded_buffers[col]):
+            merged_values[pk] = value
+
+        if col in table:  # overlapping column names as suffixed by pd.merge()
+            table[col + "_x"] = table.pop(col)
+            expanded_buffers[col + "_y"] = expanded_buffers.pop(col)
+            col += "_y"
+        table[col] = merged_values
+
+    return table, expanded_buffers
+
+
+# projecting paths (tables/columns to breakdown)
+def compile_path_projection(include_paths: List[str] = None,
+                            exclude_paths: List[str] = None) -> Union[Dict[str, Any], None]:
+    """
+    Compile include/exclude paths into a projection (None if no paths are given).
+
+    Paths are table tags (e.g. 'root_0<people_1'), optionally followed by '.' and a column of the table
+    (object keys joined with '.', e.g. 'root_0<people_1.name' or 'root_0.meta.source'). Since keys can end
+    in '_<n>' or hold '.', paths are matched against the tables and columns the walk finds (see
+    is_table_projected() and is_column_projected()), noting which ones matched (see check_path_projection()).
+
+    Included tables keep their subtables and the tables above them (for their keys), excluded tables lose
+    their subtables. Columns are included/excluded along with anything expanded from them.
+    """
+    if include_paths is None and exclude_paths is None:
+        return None
+
+    return {"include_paths": None if include_paths is None else list(include_paths),
+            "exclude_paths": list(exclude_paths or list()),
+            "matched_paths": set()}
+
+
+def check_path_projection(projection: Union[Dict[str, Any], None]):
+    """
+    Raise a ValueError if any of a projection's paths matched no table or column.
+    """
+    if projection is None:
+        return
+
+    unmatched_paths = [path for path in (projection["include_paths"] or list()) + projection["exclude_paths"]
+                       if path not in projection["matched_paths"]]
+    if len(unmatched_paths) > 0:
+        raise ValueError(f"paths matching no table or column: {unmatched_paths} (expected table tags, "
+                         "optionally followed by '.column')")
+
+
+def is_table_projected(tag: str, projection: Union[Dict[str, Any], None]) -> bool:
+    """
+    Check if a table is kept by a projection, noting the paths naming it.
+    """
+    if projection is None:
+        return True
+    for excluded_path in projection["exclude_paths"]:
+        if tag == excluded_path:
+            projection["matched_paths"].add(excluded_path)
+        if tag == excluded_path or tag.startswith(excluded_path + "<"):
+            return False
+    if projection["include_paths"] is None:
+        return True
+
+    # the columns this table (and the tables above it) got expanded from
+    components = tag.split("<")
+    col_paths = ["<".join(components[:level]) + "." + components[level].rsplit("_", 1)[0]
+                 for level in range(1, len(components))]
+
+    kept = False
+    for included_path in projection["include_paths"]:
+        if tag == included_path:
+            projection["matched_paths"].add(included_path)
+        kept = kept or tag == included_path or tag.startswith(included_path + "<") or any(
+            included_path.startswith(tag + separator) for separator in "<.") or any(
+            col_path == included_path or col_path.startswith(included_path + ".") or included_path.startswith(
+                col_path + ".") for col_path in col_paths)
+
+    return kept
+
+
+def is_column_projected(col: str,
+                        tag: str,
+                        include_paths: Union[List[str], None],
+                        exclude_paths: List[str],
+                        matched_paths: Set[str]) -> bool:
+    """
+    Check if a column of a table is kept (columns named after an object's keys follow the object's column),
+    noting the paths naming it.
+
+    Included columns are those of the include paths, the objects holding them and the arrays leading to
+    included tables below.
+    """
+    path = f"{tag}.{col}"
+    for excluded_path in exclude_paths:
+        if path == excluded_path or path.startswith(excluded_path + "."):
+            matched_paths.add(excluded_path)
+            return False
+    if include_paths is None:
+        return True
+
+    child_df_tag = f"{tag}<{col}_{int(tag.split('_')[-1]) + 1}"
+    kept = False
+    for included_path in include_paths:
+        if path == included_path or path.startswith(included_path + "."):
+            matched_paths.add(included_path)
+            kept = True
+        kept = kept or included_path.startswith(path + ".") or included_path.startswith(f"{tag}<{col}.") or (
+            included_path == child_df_tag) or any(included_path.startswith(child_df_tag + separator)
+                                                  for separator in "<.")
+
+    return kept
+
+
+def get_column_filter(tag: str,
+                      projection: Union[Dict[str, Any], None]) -> Union[Callable[[str], bool], None]:
+    """
+    Get the check for which columns of a table a projection keeps (None if it keeps all of them).
+
+    Tables an include path names (or lies below) keep all of their columns, other tables only get limited
+    by include paths naming their columns.
+    """
+    if projection is None:
+        return None
+
+    exclude_paths = [path for path in projection["exclude_paths"] if path.startswith(tag + ".")]
+    include_paths = projection["include_paths"] or list()
+    if any(tag == included_path or tag.startswith(included_path + "<") for included_path in include_paths) or (
+            not any(path.startswith(tag + ".") for path in include_paths)):
+        include_paths = None
+    else:  # the included columns and the arrays leading to included tables below
+        include_paths = [path for path in include_paths
+                         if path.startswith(tag + ".") or path.startswith(tag + "<")]
+    if include_paths is None and len(exclude_paths) == 0:
+        return None
+
+    return functools.partial(is_column_projected, tag=tag, include_paths=include_paths,
+                             exclude_paths=exclude_paths, matched_paths=projection["matched_paths"])
+
+
+def get_buffer_cols_to_breakdown(buffers: Dict[str, List[Any]]) -> Dict[type, List[str]]:
+    """
+    Figure out what columns hold objects/arrays (columns with both are listed under both).
+    """
+    col2types = {col: set(map(type, values)) for col, values in buffers.items()}
+
+    return {type_: [col for col, types in col2types.items() if type_ in types]
+            for type_ in [dict, list]}
+
+
+def record_unseen_cols(table_plan: Dict[str, List[Any]],
+                       cols: List[str],
+                       current_df_tag: str,
+                       unseen_paths: List[Tuple[str, str]]) -> List[str]:
+    """
+    Add the columns a table plan hasn't seen to it, reporting them as unseen paths (except the keys).
+    """
+    known_cols = set(table_plan["columns"])
+    unseen_cols = [col for col in cols if col not in known_cols]
+    table_plan["columns"].extend(unseen_cols)
+    unseen_paths.extend([(current_df_tag, col) for col in unseen_cols
+                         if col not in ["FK", "subarray_IDX", current_df_tag + "_PK"]])
+
+    return unseen_cols
+
+
+def walk_column(table: Dict[str, List[Any]],
+                col_to_break: str,
+                kind: str,
+                current_df_tag: str,
+                drop_empty: bool,
+                table_tag2buffers: Dict[str, Tuple[Dict[str, List[Any]], int]],
+                needed_tags: Set[str] = None,
+                projection: Dict[str, Any] = None,
+                typed: bool = False,
+                table_tag2row_types: Dict[str, List[str]] = None) -> Dict[str, List[Any]]:
+    """
+    Expand a column as an 'array' (queueing a child table) or an 'object' (merging its columns back).
+
+    Arrays whose child table isn't among the needed tags (if given) or is projected out are dropped
+    without expanding them. Given table_tag2row_types, the cell type of each child row is kept there
+    (see walk_array_column()).
+    """
+    current_level = int(current_df_tag.split("_")[-1])
+    current_pk_col = current_df_tag + "_PK"
+    if kind == "array":
+        child_df_tag = f"{current_df_tag}<{col_to_break}_{current_level + 1}"
+        if (needed_tags is None or child_df_tag in needed_tags) and is_table_projected(
+                child_df_tag, projection):
+            table_tag2buffers[child_df_tag] = walk_array_column(
+                table[col_to_break], col_to_break, current_pk_col, drop_empty,
+                get_column_filter(child_df_tag, projection), typed,
+                None if table_tag2row_types is None else table_tag2row_types.setdefault(child_df_tag, list()))
+        del table[col_to_break]
+        return table
+
+    return walk_object_column(table, col_to_break, current_pk_col, drop_empty,
+                              get_column_filter(current_df_tag, projection))[0]
+
+
+def get_new_cols_to_check(table_plan: Dict[str, List[Any]],
+                          table: Dict[str, List[Any]],
+                          cols_before: List[str],
+                          planned_cols: Set[str],
+                          current_df_tag: str,
+                          unseen_paths: List[Tuple[str, str]],
+                          check_leaves: bool) -> List[str]:
+    """
+    Get the columns new to a table after expanding one of its columns (merged or renamed by the merge) that need
+    their types checked, adding the ones the plan hasn't seen to it.
+    """
+    cols_before = set(cols_before)
+    new_cols = [col for col in table if col not in cols_before]
+    unseen_cols = record_unseen_cols(
+        table_plan, new_cols, current_df_tag, unseen_paths)
+
+    return unseen_cols if not check_leaves else [col for col in new_cols
+                                                  if col not in planned_cols]
+
+
+def extend_cols_to_breakdown(type2cols_to_breakdown: Dict[type, List[str]],
+                             table: Dict[str, List[Any]],
+                             col_to_break: str,
+                             new_buffers: Dict[str, List[Any]]) -> Dict[type, List[str]]:
+    """
+    Add the new object/array columns of a table to the columns to breakdown (and drop the one just broken down).
+    """
+    new_type2cols = get_buffer_cols_to_breakdown(new_buffers)
+    for type_, cols in type2cols_to_breakdown.items():
+        # columns renamed by an overlapping merge
+        cols[:] = [col + "_x" if col not in table and col != col_to_break
+                   else col for col in cols]
+        cols.extend([col for col in new_type2cols[type_] if col not in cols])
+        if col_to_break in cols:  # broken down now
+            cols.remove(col_to_break)
+
+    return type2cols_to_breakdown
+
+
+def walk_table(table: Dict[str, List[Any]],
+               n_rows: int,
+               current_df_tag: str,
+               drop_empty: bool,
+               table_tag2buffers: Dict[str, Tuple[Dict[str, List[Any]], int]],
+               table_plan: Dict[str, List[Any]] = None,
+               unseen_paths: List[Tuple[str, str]] = None,
+               check_leaves: bool = True,
+               needed_tags: Set[str] = None,
+               projection: Dict[str, Any] = None,
+               typed: bool = False,
+               table_tag2row_types: Dict[str, List[str]] = None) -> Dict[str, List[Any]]:
+    """
+    Breakdown the object/array columns of a single table's buffers, queueing child tables.
+
+    Given a table plan ({"steps": [[col, "object"/"array"], ...], "columns": [...]}) the planned expansions are
+    done first, without checking types. Columns the plan hasn't seen are then checked and broken down as usual,
+    and added to the plan. With check_leaves the planned columns are checked too: planned expansions are
+    skipped for columns without objects/arrays in these records and switch kind for objects that turned into
+    arrays (or arrays into objects), and columns the plan saw holding simple values are broken down if they
+    turned into objects/arrays. Those columns are reported as unseen paths.
+
+    Columns projected out (see compile_path_projection()) are dropped before anything else.
+    """
+    current_pk_col = current_df_tag + "_PK"
+    keep_col = get_column_filter(current_df_tag, projection)
+    if keep_col is not None:
+        table = {col: values for col, values in table.items()
+                 if col in ["FK", "subarray_IDX"] or keep_col(col)}
+    table_plan = {"steps": list(), "columns": list()
+                  } if table_plan is None else table_plan
+    unseen_paths = list() if unseen_paths is None else unseen_paths
+
+    # only columns the plan hasn't seen (or saw holding simple values) need their types checked
+    known_cols = set(table_plan["columns"])
+    planned_cols = {col for col, _ in table_plan["steps"]}
+    unseen_cols = record_unseen_cols(
+        table_plan, list(table), current_df_tag, unseen_paths)
+    type2cols_to_breakdown = get_buffer_cols_to_breakdown(
+        {col: table[col] for col in (unseen_cols if not check_leaves
+                                     else [col for col in table if col not in planned_cols])})
+    table[current_pk_col] = list(range(n_rows))
+
+    # planned expansions
+    for step in list(table_plan["steps"]):
+        col_to_break, kind = step
+        if col_to_break not in table:  # nothing at this path in these records
+            continue
+        if check_leaves:
+            types = set(map(type, table[col_to_break]))
+            if dict not in types and list not in types:  # only simple values in these records
+                continue
+            if kind != ("array" if list in types else "object"):
+                step[1] = kind = "array" if list in types else "object"
+                unseen_paths.append((current_df_tag, col_to_break))
+
+        cols_before = list(table)
+        table = walk_column(table, col_to_break, kind, current_df_tag, drop_empty,
+                            table_tag2buffers, needed_tags, projection, typed, table_tag2row_types)
+        new_cols = get_new_cols_to_check(table_plan, table, cols_before, planned_cols,
+                                         current_df_tag, unseen_paths, check_leaves)
+        type2cols_to_breakdown = extend_cols_to_breakdown(
+            type2cols_to_breakdown, table, col_to_break,
+            {col: table[col] for col in new_cols})
+
+    # columns the plan hasn't seen (or saw holding simple values)
+    while True:  # still columns to breakdown
+        try:
+            col_to_break = (type2cols_to_breakdown[dict]
+                            + type2cols_to_breakdown[list])[0]
+        except IndexError:
+            break
+
+        kind = "array" if col_to_break in type2cols_to_breakdown[list] else "object"
+        table_plan["steps"].append([col_to_break, kind])
+        if col_to_break in known_cols:  # held simple values when the plan saw it
+            unseen_paths.append((current_df_tag, col_to_break))
+        cols_before = list(table)
+        table = walk_column(table, col_to_break, kind, current_df_tag, drop_empty,
+                            table_tag2buffers, needed_tags, projection, typed, table_tag2row_types)
+        new_cols = get_new_cols_to_check(table_plan, table, cols_before, planned_cols,
+                                         current_df_tag, unseen_paths, check_leaves)
+        type2cols_to_breakdown = extend_cols_to_breakdown(
+            type2cols_to_breakdown, table, col_to_break,
+            {col: table[col] for col in new_cols})
+
+    return table
+
+
+def get_needed_table_tags(tags: Iterable[str]) -> Set[str]:
+    """
+    Get the tags of the given tables and of every table above them (needed for their keys).
+    """
+    components = [tag.split("<") for tag in tags]
+
+    return {"<".join(tag_components[:level + 1]) for tag_components in components
+            for level in range(len(tag_components))}
+
+
+def get_root_buffers(data: Union[List[Dict[str, Any]], Dict[str, Any]]) -> Tuple[Dict[str, List[Any]], int]:
+    """
+    Get the column buffers of the root table (and its row count).
+    """
+    if isinstance(data, dict):
+        data = [data]
+
+    if all(isinstance(record, dict) for record in data):
+        return rows_to_buffers(data), len(data)
+
+    # let pandas decide on the layout of unusual record types
+    df = pd.DataFrame(data)
+    return {col: df[col].tolist() for col in list(df)}, len(data)
+
+
+def walk_tables(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                endpoint_name: str,
+                drop_empty: bool,
+                table_tag2plan: Dict[str, Dict[str, List[Any]]] = None,
+                unseen_paths: List[Tuple[str, str]] = None,
+                check_leaves: bool = True,
+                tags: Iterable[str] = None,
+                projection: Dict[str, Any] = None,
+                typed: bool = False,
+                table_tag2row_types: Dict[str, List[str]] = None) -> Iterator[Tuple[str, Dict[str, List[Any]]]]:
+    """
+    Walk the records table by table (breadth first), yielding each table's tag and final column buffers.
+
+    Given tags, only those tables (and the ones above them) are walked. Given a projection, tables and
+    columns projected out are never walked.
+    """
+    needed_tags = None if tags is None else get_needed_table_tags(tags)
+    if (needed_tags is not None and f"{endpoint_name}_0" not in needed_tags) or not is_table_projected(
+            f"{endpoint_name}_0", projection):
+        return
+
+    table_tag2buffers = {f"{endpoint_name}_0": get_root_buffers(data)}
+    while len(table_tag2buffers) > 0:
+        current_df_tag = next(iter(table_tag2buffers))
+        table, n_rows = table_tag2buffers[current_df_tag]
+        table_plan = None if table_tag2plan is None else table_tag2plan.setdefault(
+            current_df_tag, {"steps": list(), "columns": list()})
+        table = walk_table(table, n_rows, current_df_tag, drop_empty, table_tag2buffers, table_plan,
+                           unseen_paths, check_leaves, needed_tags, projection, typed, table_tag2row_types)
+        del table_tag2buffers[current_df_tag]
+
+        yield current_df_tag, table
+
+
+def native_breakdown_json(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                          endpoint_name: str,
+                          drop_empty: bool,
+                          table_tag2plan: Dict[str, Dict[str, List[Any]]] = None,
+                          unseen_paths: List[Tuple[str, str]] = None,
+                          check_leaves: bool = True,
+                          tags: Iterable[str] = None,
+                          projection: Dict[str, Any] = None,
+                          typed: bool = False) -> Dict[str, PandasDataFrame]:
+    """
+    Breakdown json data by walking the records and appending to per-table column buffers.
+
+    Each table's buffers are turned into a dataframe once (after all of its columns are broken down).
+    Table plans (see walk_table()) are followed and updated when given. Given tags, only those tables
+    and the ones above them are broken down, and given a projection only the tables/columns it keeps.
+    When typed, missing values stay null (see process_final_table()).
+    """
+    table_tag2df = {current_df_tag: process_final_table(pd.DataFrame(table), current_df_tag + "_PK",
+                                                        current_df_tag, typed)
+                    for current_df_tag, table in walk_tables(data, endpoint_name, drop_empty, table_tag2plan,
+                                                             unseen_paths, check_leaves, tags, projection, typed)}
+    if tags is None:
+        check_path_projection(projection)
+
+    return table_tag2df
+
+
+# arrow engine (flattens list columns using their offsets instead of walking the records)
+def check_arrow_layout(array: Any) -> bool:
+    """
+    Check that an arrow array only holds layouts the arrow engine breaks down as the other engines do:
+    no missing objects/arrays inside arrays, and arrays of arrays only holding simple values.
+    """
+    if pa.types.is_struct(array.type):
+        return all(check_arrow_layout(field) for field in array.flatten())
+
+    if pa.types.is_list(array.type):
+        items = pc.list_flatten(array)
+        if pa.types.is_nested(items.type) and items.null_count > 0:
+            return False
+        if pa.types.is_list(items.type):
+            return not pa.types.is_nested(items.type.value_type)
+        return check_arrow_layout(items)
+
+    return not pa.types.is_nested(array.type)
+
+
+def collect_key_orders(value: Any,
+                       path: Tuple[Union[str, None], ...],
+                       path2keys: Dict[Tuple[Union[str, None], ...], Dict[str, None]]):
+    """
+    Collect the keys of the objects at each path (None for array items) in order of first appearance.
+
+    Arrow sorts the keys of the objects it loads, which would reorder columns and tables.
+    """
+    if isinstance(value, dict):
+        keys = path2keys.setdefault(path, dict())
+        for key, subvalue in value.items():
+            keys[key] = None
+            if isinstance(subvalue, (dict, list)):
+                collect_key_orders(subvalue, path + (key,), path2keys)
+
+    elif len(value) > 0 and isinstance(value[0], (dict, list)):
+        for item in value:
+            collect_key_orders(item, path + (None,), path2keys)
+
+
+def flatten_arrow_struct(array: Any,
+                         path: Tuple[Union[str, None], ...],
+                         path2keys: Dict[Tuple[Union[str, None], ...], Dict[str, None]],
+                         prefix: str = None) -> Dict[str, Any]:
+    """
+    Flatten a struct array into columns as flatten_record() (without a prefix) or flatten_nested_value() do.
+
+    Missing objects leave their fields missing (not a column of their own).
+    """
+    name2field = dict(zip([field.name for field in array.type], array.flatten()))
+    name2field = {name: name2field[name]
+                  for name in path2keys.get(path, dict()) if name in name2field}
+    if prefix is None:  # top level objects are appended after the other keys
+        name2field = {**{name: field for name, field in name2field.items()
+                         if not pa.types.is_struct(field.type)},
+                      **{name: field for name, field in name2field.items()
+                         if pa.types.is_struct(field.type)}}
+
+    columns = dict()
+    for name, field in name2field.items():
+        flat_name = name if prefix is None else prefix + "." + name
+        if pa.types.is_struct(field.type):
+            columns.update(flatten_arrow_struct(
+                field, path + (name,), path2keys, flat_name))
+        else:
+            columns[flat_name] = (field, path + (name,))
+
+    return columns
+
+
+def spread_arrow_list_items(items: Any, col_to_break: str) -> Dict[str, Any]:
+    """
+    Spread array items (arrays of simple values) over one column per index, padding with nulls.
+    """
+    lengths = pc.list_value_length(items).to_numpy(zero_copy_only=False)
+    starts = np.cumsum(lengths) - lengths
+    values = pc.list_flatten(items)
+    width = int(lengths.max())
+    names = [col_to_break + f"_idx_{num}" for num in range(width)
+             ] if width > 1 else [col_to_break] * width
+
+    return {name: pc.take(values, pa.array(starts + num, mask=lengths <= num))
+            for num, name in enumerate(names)}
+
+
+def is_empty_arrow_column(array: Any) -> bool:
+    """
+    Check if a column has no data (nulls or NaN only).
+    """
+    n_missing = array.null_count
+    if pa.types.is_floating(array.type):
+        n_missing += pc.sum(pc.is_nan(array)).as_py() or 0
+
+    return n_missing == len(array)
+
+
+def expand_arrow_list_column(array: Any,
+                             path: Tuple[Union[str, None], ...],
+                             path2keys: Dict[Tuple[Union[str, None], ...], Dict[str, None]],
+                             col_to_break: str,
+                             fill_missing: bool,
+                             drop_empty: bool) -> Tuple[Dict[str, Tuple[Any, Tuple[Union[str, None], ...]]], int]:
+    """
+    Expand a list column into the (column, path) pairs of a child table (and its row count).
+
+    Each item's parent row (FK) and position in its array (subarray_IDX) come from the list offsets.
+    Missing arrays of child tables get a row of their own (as "" filled values do with the other engines).
+    """
+    lengths = pc.list_value_length(array).fill_null(
+        0).to_numpy(zero_copy_only=False)
+    owners = np.repeat(np.arange(len(array)), lengths)
+    subarray_idxs = np.arange(len(owners)) - \
+        np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    items, item_path = pc.list_flatten(array), path + (None,)
+    if len(items) == 0:
+        columns = dict()
+    elif pa.types.is_struct(items.type):
+        columns = flatten_arrow_struct(items, item_path, path2keys)
+    elif pa.types.is_list(items.type):
+        columns = {col: (values, item_path + (None,)) for col, values in
+                   spread_arrow_list_items(items, col_to_break).items()}
+    else:
+        columns = {col_to_break: (items, item_path)}
+
+    missing_owners = np.flatnonzero(pc.is_null(array).to_numpy(
+        zero_copy_only=False)) if fill_missing else np.array([], dtype=int)
+    if len(missing_owners) > 0:
+        columns = {col: (pa.concat_arrays([values, pa.nulls(len(missing_owners), values.type)]), col_path)
+                   for col, (values, col_path) in columns.items()}
+        columns.setdefault(col_to_break, (pa.nulls(
+            len(owners) + len(missing_owners)), item_path))
+        owners = np.concatenate([owners, missing_owners])
+        subarray_idxs = np.concatenate(
+            [subarray_idxs, np.zeros(len(missing_owners), dtype=int)])
+
+    columns.update({"FK": (pa.array(owners, type=pa.int64()), None),
+                    "subarray_IDX": (pa.array(subarray_idxs, type=pa.int64()), None)})
+    if drop_empty:
+        columns = {col: (values, col_path) for col, (values, col_path) in columns.items()
+                   if not is_empty_arrow_column(values)
+                   or (col == col_to_break and len(missing_owners) > 0)}
+
+    return columns, len(owners)
+
+
+def arrow_breakdown_json(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                         endpoint_name: str,
+                         drop_empty: bool) -> Dict[str, PandasDataFrame]:
+    """
+    Breakdown json data loaded into arrow arrays, creating child tables by flattening list columns.
+
+    Gives the same tables, keys and values as the native engine, except that objects that are sometimes missing
+    don't leave an (empty) column of their own and columns may be ordered differently when records have differing
+    keys. Records arrow can't load or lay out that way (e.g. mixing types) are broken down with the native engine
+    (warning with an EngineFallbackWarning).
+    """
+    if pa is None:
+        raise ImportError("the arrow engine needs pyarrow (pip install pyarrow)")
+    if isinstance(data, dict):
+        data = [data]
+
+    try:
+        records = pa.array(data) if len(data) > 0 and all(
+            isinstance(record, dict) for record in data) else None
+        fallback_reason = "the records aren't all objects" if records is None else None
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError) as error:
+        records, fallback_reason = None, f"arrow can't load the records ({error})"
+    if records is not None and (not pa.types.is_struct(records.type) or not check_arrow_layout(records)):
+        fallback_reason = "the records hold missing objects/arrays inside arrays or arrays of arrays of objects"
+    if fallback_reason is not None:
+        warnings.warn(f"breaking down with the native engine since {fallback_reason}",
+                      EngineFallbackWarning, stacklevel=2)
+        return native_breakdown_json(data, endpoint_name, drop_empty)
+
+    path2keys = dict()
+    collect_key_orders(data, tuple(), path2keys)
+    root_columns = flatten_arrow_struct(records, (None,), path2keys)
+    if drop_empty:  # only columns expanded from objects are dropped
+        root_columns = {col: (values, path) for col, (values, path) in root_columns.items()
+                        if len(path) <= 2 or not is_empty_arrow_column(values)}
+
+    table_tag2columns = {f"{endpoint_name}_0": (root_columns, len(data))}
+    table_tag2processed_df = dict()
+    while len(table_tag2columns) > 0:
+        current_df_tag = next(iter(table_tag2columns))
+        columns, n_rows = table_tag2columns.pop(current_df_tag)
+        current_level = int(current_df_tag.split("_")[-1])
+        current_pk_col = current_df_tag + "_PK"
+
+        for col in [col for col, (values, _) in columns.items() if pa.types.is_list(values.type)]:
+            values, path = columns.pop(col)
+            table_tag2columns[f"{current_df_tag}<{col}_{current_level + 1}"] = expand_arrow_list_column(
+                values, path, path2keys, col, current_level > 0, drop_empty)
+
+        df = pa.table({col: values for col, (values, _) in columns.items()}).to_pandas(
+        ) if len(columns) > 0 else pd.DataFrame(index=range(n_rows))
+        df[current_pk_col] = range(n_rows)
+        table_tag2processed_df[current_df_tag] = process_final_table(
+            df, current_pk_col, current_df_tag)
+
+    return table_tag2processed_df
+
+
+# combining atomic tables of separately broken down records
+def get_parent_table_tag(tag: str) -> Union[str, None]:
+    """
+    Get the tag of the table a child table references (None for the root table).
+    """
+    components = tag.split("<")
+
+    return "<".join(components[:-1]) if len(components) > 1 else None
+
+
+def offset_table_keys(table_tag2df: Dict[str, PandasDataFrame],
+                      tag2offset: Dict[str, int]) -> Dict[str, PandasDataFrame]:
+    """
+    Shift the PK/FK of each table by the rows already seen for the table (and its parent table).
+
+    The offsets are updated with the rows of these tables afterwards.
+    """
+    for tag, df in table_tag2df.items():
+        df["PK"] += tag2offset.get(tag, 0)
+        if "FK" in list(df):
+            df["FK"] += tag2offset.get(get_parent_table_tag(tag), 0)
+
+    for tag, df in table_tag2df.items():
+        tag2offset[tag] = tag2offset.get(tag, 0) + len(df)
+
+    return table_tag2df
+
+
+def concat_table_chunks(table_tag2df_chunks: Iterable[Dict[str, PandasDataFrame]],
+                        typed: bool = False) -> Dict[str, PandasDataFrame]:
+    """
+    Append chunked atomic tables into one table per tag (columns missing from a chunk are left empty,
+    or null if the chunks are typed).
+
+    Tags are ordered by level (then by first appearance), columns by first appearance. Each chunk is laid
+    out on its own records, so this only matches a single breakdown for chunks of the same shape.
+    """
+    tag2dfs = dict()
+    for table_tag2df in table_tag2df_chunks:
+        for tag, df in table_tag2df.items():
+            tag2dfs.setdefault(tag, []).append(df)
+
+    tag2df = {tag: pd.concat(tag2dfs[tag], axis=0, ignore_index=True)
+              for tag in sorted(tag2dfs, key=lambda tag: tag.count("<"))}
+
+    return {tag: df.convert_dtypes() if typed else df.fillna("")
+            for tag, df in tag2df.items()}
+
+
+# breaking down shards of records in parallel (each shard is walked after records showing the shape of all
+# of them, so every table, column, cast and row layout is decided as in a serial breakdown)
+def get_spread_length(item: Any) -> int:
+    """
+    Get the number of columns an array item is spread over when the array's items are arrays (see walk_list_records()).
+    """
+    return len(item) if isinstance(item, (list, str, dict)) else 1
+
+
+def get_shape_node() -> Dict[str, Any]:
+    """
+    Get an empty node of a records' shape (what's been seen at a path, see update_record_shape()).
+    """
+    return {"types": set(), "keys": dict(), "missing": set(), "items": dict(), "lengths": None}
+
+
+def update_record_shape(value: Any,
+                        node: Dict[str, Any],
+                        in_array: bool = False) -> bool:
+    """
+    Add what a (sub)value shows about the shape of the records to its node: the types found (NaN apart from
+    other floats), object keys missing from later objects and the shortest/longest array items.
+
+    Items of arrays inside arrays get a node per index (they're spread over a column each). Returns True if
+    the value shows anything the shape hadn't seen.
+    """
+    token = "nan" if isinstance(value, float) and value != value else type(value)
+    is_new = token not in node["types"]
+    if is_new:
+        node["types"].add(token)
+
+    if isinstance(value, dict):
+        keys = node["keys"]
+        missing_keys = keys.keys() - value.keys() - node["missing"]
+        if len(missing_keys) > 0:
+            node["missing"].update(missing_keys)
+            is_new = True
+        for key, subvalue in value.items():
+            subnode = keys.get(key)
+            if subnode is None:
+                subnode = keys[key] = get_shape_node()
+            if isinstance(subvalue, (dict, list)):
+                is_new = update_record_shape(subvalue, subnode) or is_new
+            else:  # (simple values inline, they're most of the records)
+                token = "nan" if isinstance(subvalue, float) and subvalue != subvalue else type(subvalue)
+                if token not in subnode["types"]:
+                    subnode["types"].add(token)
+                    is_new = True
+
+    elif isinstance(value, list) and len(value) > 0:
+        items = node["items"]
+        for position, item in enumerate(value):
+            item_key = position if in_array else None
+            item_node = items.get(item_key)
+            if item_node is None:
+                item_node = items[item_key] = get_shape_node()
+            if isinstance(item, (dict, list)):
+                is_new = update_record_shape(item, item_node, True) or is_new
+            else:
+                token = "nan" if isinstance(item, float) and item != item else type(item)
+                if token not in item_node["types"]:
+                    item_node["types"].add(token)
+                    is_new = True
+
+        lengths = [get_spread_length(item) for item in value]
+        bounds = [min(lengths), max(lengths)] if node["lengths"] is None else node["lengths"]
+        if node["lengths"] is None or min(lengths) < bounds[0] or max(lengths) > bounds[1]:
+            node["lengths"] = [min(bounds[0], *lengths), max(bounds[1], *lengths)]
+            is_new = True
+
+    return is_new
+
+
+def get_shape_positions(records: List[Any]) -> List[int]:
+    """
+    Get the positions of the records that show something about their shape the records before them don't.
+    """
+    shape = get_shape_node()
+
+    return [position for position, record in enumerate(records)
+            if update_record_shape(record, shape)]
+
+
+def walk_shard_tables(records: List[Any],
+                      shape_records: List[Any],
+                      endpoint_name: str,
+                      drop_empty: bool,
+                      projection: Dict[str, Any] = None,
+                      typed: bool = False) -> List[Tuple[str, Dict[str, List[Any]], List[int]]]:
+    """
+    Walk a shard of the records following the records showing the shape of all of them, then drop the rows the
+    shape records left in each table.
+
+    Returns each table's tag, buffers (keys numbered within the shard) and the rank of the cell type each
+    child row comes from (the same in every shard).
+    """
+    table_tag2row_types, tag2new_pks = dict(), dict()
+    shard_tables = list()
+    for current_df_tag, table in walk_tables(shape_records + records, endpoint_name, drop_empty,
+                                             projection=projection, typed=typed,
+                                             table_tag2row_types=table_tag2row_types):
+        parent_df_tag = get_parent_table_tag(current_df_tag)
+        if parent_df_tag is None:
+            kept = [pk >= len(shape_records) for pk in table[current_df_tag + "_PK"]]
+        else:
+            kept = [tag2new_pks[parent_df_tag][fk] >= 0 for fk in table.get("FK", list())]
+        tag2new_pks[current_df_tag] = np.cumsum(kept) - 1
+        tag2new_pks[current_df_tag][~np.array(kept, dtype=bool)] = -1
+
+        table = {col: [value for value, keep in zip(values, kept) if keep]
+                 for col, values in table.items()}
+        table[current_df_tag + "_PK"] = list(range(sum(kept)))
+        if "FK" in table:  # (empty tables have no keys with drop_empty)
+            table["FK"] = tag2new_pks[parent_df_tag][table["FK"]].tolist()
+        # rows are grouped by cell type in order of first appearance, which the shape records fix
+        row_types = table_tag2row_types.get(current_df_tag, list())
+        type2rank = {row_type: rank for rank, row_type in enumerate(dict.fromkeys(row_types))}
+        shard_tables.append((current_df_tag, table, [type2rank[row_type] for row_type, keep
+                                                     in zip(row_types, kept) if keep]))
+
+    return shard_tables
+
+
+def concat_shard_tables(shards_tables: List[List[Tuple[str, Dict[str, List[Any]], List[int]]]],
+                        typed: bool = False) -> Dict[str, PandasDataFrame]:
+    """
+    Append the tables of each shard (see walk_shard_tables()) into atomic tables.
+
+    Rows of a child table are ordered by the type of their cell (in order of first appearance), then by
+    parent row, and renumbered, as in a serial breakdown.
+    """
+    shard_tag2tables = [{tag: (table, row_ranks) for tag, table, row_ranks in shard_tables}
+                        for shard_tables in shards_tables]
+    tags = list(dict.fromkeys(tag for shard_tables in shards_tables for tag, _, _ in shard_tables))
+
+    tag2shard_pks, table_tag2processed_df = dict(), dict()
+    for current_df_tag in tags:
+        current_pk_col = current_df_tag + "_PK"
+        parent_df_tag = get_parent_table_tag(current_df_tag)
+        parts = [tag2table.get(current_df_tag, ({current_pk_col: [], "FK": []}, []))
+                 for tag2table in shard_tag2tables]
+        cols = list(dict.fromkeys(col for table, _ in parts for col in table))
+        sizes = [len(table[current_pk_col]) for table, _ in parts]
+
+        if parent_df_tag is None:
+            order = np.arange(sum(sizes))
+            fks = None
+        else:
+            fks = np.concatenate([np.asarray(pks, dtype=int)[np.asarray(table.get("FK", list()), dtype=int)]
+                                  for pks, (table, _) in zip(tag2shard_pks[parent_df_tag], parts)])
+            ranks = [rank for _, row_ranks in parts for rank in row_ranks]
+            order = np.lexsort((fks, ranks))
+
+        new_pks = np.empty(len(order), dtype=int)
+        new_pks[order] = np.arange(len(order))
+        tag2shard_pks[current_df_tag] = np.split(new_pks, np.cumsum(sizes)[:-1])
+
+        table = dict()
+        for col in cols:
+            values = [value for part, size in zip(parts, sizes)
+                      for value in part[0].get(col, [np.nan] * size)]
+            table[col] = [values[position] for position in order]
+        table[current_pk_col] = list(range(len(order)))
+        if "FK" in table:
+            table["FK"] = fks[order].tolist()
+
+        table_tag2processed_df[current_df_tag] = process_final_table(
+            pd.DataFrame(table), current_pk_col, current_df_tag, typed)
+
+    return table_tag2processed_df
+
+
+def parallel_breakdown_json(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                            endpoint_name: str,
+                            drop_empty: bool,
+                            workers: int,
+                            projection: Dict[str, Any] = None,
+                            typed: bool = False) -> Dict[str, PandasDataFrame]:
+    """
+    Breakdown contiguous shards of the records in separate processes, giving the same tables as a serial
+    native breakdown.
+
+    A first pass finds the records showing the shape of all of them (see update_record_shape()) and each shard
+    is walked (natively) after them, so object/array columns, columns, casts and row layouts are decided on
+    the whole data. The shards' rows are then renumbered and appended (see concat_shard_tables()).
+
+    When the shape records outnumber MAX_SHAPE_RECORD_SHARE of a shard (e.g. records keyed by ids, each
+    showing new keys) every worker would walk about as much as a serial breakdown, so the records are broken
+    down serially instead.
+    """
+    if isinstance(data, dict):
+        data = [data]
+    shard_size = -(-len(data) // workers)  # ceiling division
+    shards = [data[start:start + shard_size]
+              for start in range(0, len(data), shard_size)]
+
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        shard_positions = list(executor.map(get_shape_positions, shards))
+        shape = get_shape_node()
+        shape_records = [shard[position] for shard, positions in zip(shards, shard_positions)
+                         for position in positions if update_record_shape(shard[position], shape)]
+
+        if len(shape_records) > MAX_SHAPE_RECORD_SHARE * shard_size:
+            shards_tables = None
+        else:
+            walk_shard = functools.partial(walk_shard_tables, shape_records=shape_records,
+                                           endpoint_name=endpoint_name, drop_empty=drop_empty,
+                                           projection=projection, typed=typed)
+            shards_tables = list(executor.map(walk_shard, shards))
+    if shards_tables is None:
+        return native_breakdown_json(data, endpoint_name, drop_empty, projection=projection, typed=typed)
+    if projection is not None:  # the shape records hold every table and column
+        get_table_tags(shape_records, endpoint_name, drop_empty, projection)
+
+    return concat_shard_tables(shards_tables, typed)
+
+
+# compact output (smaller dtypes for keys and repeated strings)
+def is_key_column(col: str) -> bool:
+    """
+    Check if a (final) column is one of a table's keys/indices.
+    """
+    return col in ["PK", "FK"] or col.endswith(".subarray_IDX")
+
+
+def compact_table(df: PandasDataFrame,
+                  max_category_ratio: float = DEFAULT_CATEGORY_RATIO) -> PandasDataFrame:
+    """
+    Shrink a table in place: keys become the smallest unsigned integers that fit them and string columns
+    with few distinct values (at most max_category_ratio of the rows) become categoricals.
+    """
+    for col in list(df):
+        if is_key_column(col):
+            df[col] = pd.to_numeric(df[col], downcast="unsigned")
+        elif (df[col].dtype == object or isinstance(df[col].dtype, pd.StringDtype)) and \
+                pd.api.types.infer_dtype(df[col], skipna=isinstance(df[col].dtype, pd.StringDtype)) == "string" and \
+                df[col].nunique() <= max_category_ratio * len(df):
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def compact_tables(table_tag2df: Dict[str, PandasDataFrame],
+                   max_category_ratio: float = DEFAULT_CATEGORY_RATIO) -> Dict[str, PandasDataFrame]:
+    """
+    Shrink each atomic table (see compact_table()), e.g. once chunked tables' keys have been offset.
+    """
+    for df in table_tag2df.values():
+        compact_table(df, max_category_ratio)
+
+    return table_tag2df
+
+
+# lazy breakdown (tables broken down when accessed)
+def get_table_tags(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                   endpoint_name: str = "root",
+                   drop_empty: bool = False,
+                   projection: Dict[str, Any] = None) -> List[str]:
+    """
+    Get the tags of the tables json data breaks down into, walking only the records that show the data's
+    shape (see update_record_shape()). Raises a ValueError if any of the projection's paths match nothing.
+    """
+    if isinstance(data, dict):
+        data = [data]
+    shape_records = [data[position] for position in get_shape_positions(data)]
+    tags = [current_df_tag for current_df_tag, _ in walk_tables(shape_records, endpoint_name, drop_empty,
+                                                                projection=projection)]
+    check_path_projection(projection)
+
+    return tags
+
+
+class LazyTableMapping(Mapping):
+    """
+    Atomic tables of json data, each broken down (along with the tables above it) when first accessed.
+
+    Each table is walked once: walking it keeps the buffers of all of its child tables for later accesses.
+    Iterating over the tags only walks the records that show the data's shape (see get_table_tags()).
+    """
+
+    def __init__(self,
+                 data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                 endpoint_name: str = "root",
+                 drop_empty: bool = False,
+                 projection: Dict[str, Any] = None,
+                 compact: bool = False,
+                 typed: bool = False):
+        self.data = data
+        self.endpoint_name = endpoint_name
+        self.drop_empty = drop_empty
+        self.projection = projection
+        self.compact = compact
+        self.typed = typed
+        self.table_tag2df = dict()
+        self.table_tag2buffers = dict()  # tables not broken down yet (the tables above them are)
+        self.tags = None
+        if projection is not None:  # paths matching nothing are reported upfront
+            self.tags = get_table_tags(data, endpoint_name, drop_empty, projection)
+
+    def breakdown_table(self, tag: str):
+        """
+        Breakdown a table, first breaking down the tables above it if they haven't been.
+        """
+        parent_tag = get_parent_table_tag(tag)
+        if parent_tag is None and tag == f"{self.endpoint_name}_0" and is_table_projected(tag, self.projection):
+            self.table_tag2buffers[tag] = get_root_buffers(self.data)
+        elif parent_tag is not None and parent_tag not in self.table_tag2df:
+            self.breakdown_table(parent_tag)
+        if tag not in self.table_tag2buffers:
+            raise KeyError(tag)
+
+        table, n_rows = self.table_tag2buffers.pop(tag)
+        table = walk_table(table, n_rows, tag, self.drop_empty, self.table_tag2buffers,
+                           projection=self.projection, typed=self.typed)
+        df = process_final_table(pd.DataFrame(table), tag + "_PK", tag, self.typed)
+        self.table_tag2df[tag] = compact_table(df) if self.compact else df
+
+    def __getitem__(self, tag: str) -> PandasDataFrame:
+        if tag not in self.table_tag2df:
+            self.breakdown_table(tag)
+
+        return self.table_tag2df[tag]
+
+    def __iter__(self) -> Iterator[str]:
+        if self.tags is None:
+            self.tags = get_table_tags(
+                self.data, self.endpoint_name, self.drop_empty, self.projection)
+
+        return iter(self.tags)
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+    def __contains__(self, tag: Any) -> bool:
+        return tag in self.table_tag2df or tag in list(iter(self))
+
+
 def breakdown_json(data: Union[List[Dict[str, Any]], Dict[str, Any]],
                    endpoint_name: str = "root",
-                   drop_empty: bool = False) -> Dict[str, PandasDataFrame]:
+                   drop_empty: bool = False,
+                   engine: str = "pandas",
+                   workers: int = 1,
+                   lazy: bool = False,
+                   include_paths: List[str] = None,
+                   exclude_paths: List[str] = None,
+                   compact: bool = False,
+                   typed: bool = False) -> Dict[str, PandasDataFrame]:
     """
     Unpacks json data and converts to multiple long-form 'atomic' dataframes.
 
     Panda's `json_normalize()` is helpful but not too flexible, especially when dealing with nested subarrays.
     Thus this code essentially wraps this functionality while organizing the resulting unpacked data.
+
+    The 'native' engine gives the same tables without json_normalize() by walking the records once, and the
+    'arrow' engine (needs pyarrow) by flattening the records' arrays in arrow (see arrow_breakdown_json()). When
+    the arrow engine can't be used the native one is, with an EngineFallbackWarning.
+    With more than one worker, shards of the records are broken down (natively) on a process pool, giving the
+    same tables as a serial native breakdown (see parallel_breakdown_json()).
+
+    With lazy=True a LazyTableMapping is returned instead, breaking down (with the native engine) only the
+    tables that get accessed.
+
+    Include/exclude paths (table tags, optionally followed by '.column', e.g. 'root_0<people_1' or
+    'root_0.raw_payload') limit the breakdown to the tables/columns kept (see compile_path_projection()).
+    Anything projected out is dropped before it's expanded (with the native engine), and paths matching no
+    table or column raise a ValueError.
+
+    With compact=True keys are stored as the smallest unsigned integers that fit and low-cardinality
+    strings as categoricals (see compact_table()).
+
+    With typed=True missing values are kept as nulls (instead of "") and each column gets a pandas nullable
+    dtype (Int64, Float64, boolean, string, or object if it mixes types), with the native engine. Missing
+    arrays then don't leave "" rows in child tables.
     """
+    projection = compile_path_projection(include_paths, exclude_paths)
+    if engine not in ["pandas", "native", "arrow"]:
+        raise ValueError(f"unknown breakdown engine '{engine}'")
+    parallel = workers > 1 and not isinstance(data, dict) and len(data) > 1
+    if engine == "arrow" and (lazy or parallel or projection is not None or typed):
+        warnings.warn("breaking down with the native engine since the arrow engine doesn't support lazy "
+                      "breakdowns, workers, include/exclude paths or typed output", EngineFallbackWarning,
+                      stacklevel=2)
+        engine = "native"
+    if lazy:
+        return LazyTableMapping(data, endpoint_name, drop_empty, projection, compact, typed)
+    if compact:
+        return compact_tables(breakdown_json(data, endpoint_name, drop_empty, engine, workers,
+                                             include_paths=include_paths, exclude_paths=exclude_paths,
+                                             typed=typed))
+
+    if parallel:
+        return parallel_breakdown_json(data, endpoint_name, drop_empty, min(workers, len(data)),
+                                       projection, typed)
+
+    if engine == "native" or projection is not None or typed:
+        return native_breakdown_json(data, endpoint_name, drop_empty, projection=projection, typed=typed)
+    elif engine == "arrow":
+        return arrow_breakdown_json(data, endpoint_name, drop_empty)
+
     # prepare initial dataframe
     df, table_tag2df, table_tag2processed_df = initial_data_setup(
         data, endpoint_name)
@@ -0,0 +1,196 @@
+"""
+Hash-based deduplication of atomic table rows and of records across batches.
+
+Rows/records are reduced to 64-bit hashes once (tables with a unique key column skip hashing their rows).
+Records already seen in earlier batches are tracked in a seen-set with a bounded memory footprint: an exact
+set kept on disk (sqlite) or a Bloom filter with a configurable false positive rate (optionally
+memory-mapped to a file so it persists between runs).
+A plain python set of hashes works too (exact, in memory).
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import os
+import json
+import math
+import sqlite3
+import hashlib
+from typing import Union, List, Dict, Any, TypeVar, Iterable
+
+# data science
+import numpy as np
+import pandas as pd
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+DEFAULT_ERROR_RATE = 0.001  # Bloom filter false positive rate (at capacity)
+DEFAULT_CAPACITY = 10_000_000  # hashes a Bloom filter is sized for
+
+
+# hashing
+def sort_record_keys(record: Any) -> Any:
+    """
+    Sort the keys of a json record's objects by their string form (keys may mix types, e.g. int and str).
+    """
+    if isinstance(record, dict):
+        return {key: sort_record_keys(record[key]) for key in sorted(record, key=str)}
+    if isinstance(record, list):
+        return [sort_record_keys(value) for value in record]
+
+    return record
+
+
+def hash_record(record: Any) -> int:
+    """
+    Get a 64-bit hash of a json record (key order doesn't matter).
+    """
+    text = json.dumps(sort_record_keys(record), default=str, separators=(",", ":"))
+
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def hash_rows(df: PandasDataFrame) -> np.ndarray:
+    """
+    Get a 64-bit hash per row of a table (over its values only, not its index).
+
+    Columns holding objects/arrays (which can't be hashed directly) get their cells hashed as json records
+    first (see hash_record()).
+    """
+    unhashable_cols = [col for col in df if df[col].dtype == object and any(
+        isinstance(value, (dict, list)) for value in df[col])]
+    if len(unhashable_cols) > 0:
+        df = df.assign(**{col: df[col].map(lambda value: hash_record(value) if isinstance(
+            value, (dict, list)) else value) for col in unhashable_cols})
+
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def get_duplicated_rows(df: PandasDataFrame, key_cols: List[str] = None) -> np.ndarray:
+    """
+    Find the rows of a table repeating an earlier row (over all of its columns).
+
+    Rows can't repeat if one of the key columns is unique (cheap to check), otherwise rows are compared by
+    their hashes (see hash_rows()).
+    """
+    if len(df) < 2 or any(df[col].is_unique for col in key_cols or [] if col in df):
+        return np.zeros(len(df), dtype=bool)
+
+    return pd.Series(hash_rows(df)).duplicated().to_numpy()
+
+
+# seen-sets
+class BloomFilter:
+    """
+    Approximate set of 64-bit hashes: never misses a hash that was added, and wrongly reports one as
+    seen at about the error rate once it holds capacity hashes.
+
+    With a path the bits are memory-mapped to that file (reopened if it exists) so they persist between runs.
+    """
+
+    def __init__(self,
+                 capacity: int = DEFAULT_CAPACITY,
+                 error_rate: float = DEFAULT_ERROR_RATE,
+                 path: str = None):
+        self.n_bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        n_bytes = -(-self.n_bits // 8)
+        if path is None:
+            self.bits = np.zeros(n_bytes, dtype=np.uint8)
+        else:
+            self.bits = np.memmap(path, dtype=np.uint8, shape=(n_bytes,),
+                                  mode="r+" if os.path.exists(path) else "w+")
+
+    def get_bit_positions(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Get the bit positions of each hash (double hashing of its two 32-bit halves), one row per hash.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        low, high = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+
+        return (low[:, None] + steps[None, :] * high[:, None]) % np.uint64(self.n_bits)
+
+    def add_hashes(self, hashes: Iterable[int]) -> np.ndarray:
+        """
+        Add hashes, returning which of them were (probably) seen before, including earlier in the same batch.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        positions = self.get_bit_positions(hashes)
+        byte_idxs = positions // np.uint64(8)
+        masks = np.left_shift(np.uint8(1), (positions % np.uint64(8)).astype(np.uint8))
+        seen = np.all(self.bits[byte_idxs] & masks, axis=1) | pd.Series(hashes).duplicated().to_numpy()
+        np.bitwise_or.at(self.bits, byte_idxs.ravel(), masks.ravel())
+
+        return seen
+
+    def flush(self):
+        """
+        Write the bits to their file (if memory-mapped).
+        """
+        if isinstance(self.bits, np.memmap):
+            self.bits.flush()
+
+
+class DiskHashSet:
+    """
+    Exact set of 64-bit hashes kept in a sqlite file (only sqlite's page cache is held in memory).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (hash INTEGER PRIMARY KEY)")
+
+    def add_hashes(self, hashes: Iterable[int]) -> np.ndarray:
+        """
+        Add hashes, returning which of them were seen before, including earlier in the same batch.
+        """
+        seen = np.zeros(len(hashes), dtype=bool)
+        signed_hashes = np.asarray(hashes, dtype=np.uint64).view(np.int64).tolist()  # sqlite ints are signed
+        with self.connection:
+            for i, hash_ in enumerate(signed_hashes):
+                seen[i] = self.connection.execute(
+                    "INSERT OR IGNORE INTO seen VALUES (?)", (hash_,)).rowcount == 0
+
+        return seen
+
+    def flush(self):
+        """
+        Commit the hashes added so far.
+        """
+        self.connection.commit()
+
+    def close(self):
+        """
+        Close the sqlite file.
+        """
+        self.connection.close()
+
+
+def add_seen_hashes(hashes: Iterable[int],
+                    seen: Union[set, BloomFilter, DiskHashSet]) -> np.ndarray:
+    """
+    Add hashes to a seen-set, returning which of them were seen before.
+    """
+    if isinstance(seen, set):
+        seen_before = np.zeros(len(hashes), dtype=bool)
+        for i, hash_ in enumerate(hashes):
+            seen_before[i] = hash_ in seen
+            seen.add(hash_)
+        return seen_before
+
+    return seen.add_hashes(hashes)
+
+
+# deduplicating
+def drop_seen_records(records: List[Dict[str, Any]],
+                      seen: Union[set, BloomFilter, DiskHashSet]) -> List[Dict[str, Any]]:
+    """
+    Drop records seen earlier (in this batch or a previous one) and add the rest to the seen-set.
+    """
+    seen_before = add_seen_hashes([hash_record(record) for record in records], seen)
+
+    return [record for record, seen_ in zip(records, seen_before) if not seen_]
@@ -7,51 +7,115 @@ Merge atomic tables generated by 'breakdown.py'.
 
 # standard
 import re
-from typing import TypeVar, Dict, Tuple, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, TypeVar, Dict, Tuple, List, Any, Iterable, Iterator
+
+# data science
+import numpy as np
+import pandas as pd
 
 # variables
 PandasDataFrame = TypeVar("pd.DataFrame")
+DEFAULT_CHUNK_ROWS = 100000  # merged rows per chunk when merging chains in chunks
 
 
-# merging atomic tables
-def check_if_tag_has_subtables(tag: str, tag2max_level: Dict[str, int]):
+# indexing table tags
+def build_tag_index(tags: Iterable[str]) -> Dict[str, Dict[str, Any]]:
     """
-    Skipping tables with subtables to avoid redundant merged outputs.
+    Parse table tags once into a tree: each tag's parent tag, child tags, level and table name.
     """
-    if any([tag + "<" in other_tag for other_tag in tag2max_level
-            if tag != other_tag]):
-        print(f"\u274C skipping {tag} since it has subtables")
-        return True
-    else:
-        print(f"\n \u2705 creating table over chain '{tag}'")
-        return False
+    tag_index = dict()
+    for tag in tags:
+        parent_tag, _, component = tag.rpartition("<")
+        tag_index[tag] = {"parent": parent_tag or None,
+                          "children": list(),
+                          "level": tag.count("<"),
+                          "name": "_".join(component.split("_")[:-1])}
+
+    for tag, node in tag_index.items():
+        if node["parent"] in tag_index:
+            tag_index[node["parent"]]["children"].append(tag)
+
+    return tag_index
+
+
+def get_chain_tags(tag: str, tag_index: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Get the tags of each table along a chain, from the root to the given tag.
+    """
+    chain_tags = [tag]
+    while tag_index[chain_tags[-1]]["parent"] is not None:
+        chain_tags.append(tag_index[chain_tags[-1]]["parent"])
 
+    return chain_tags[::-1]
 
-def get_level_items(tag: str) -> Tuple[Dict[int, str], List[Tuple[str, str]]]:
+
+def get_tags_by_level(tag_index: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Get the tags below the root, deepest level first (in their original order within a level).
+    """
+    return sorted([tag for tag, node in tag_index.items() if node["level"] > 0],
+                  key=lambda tag: -tag_index[tag]["level"])
+
+
+# explaining merges
+def get_prefix_n_rows(table_tag2df: Dict[str, PandasDataFrame],
+                      tag_index: Dict[str, Dict[str, Any]]) -> Dict[str, Tuple[int, int]]:
     """
-    Build level to feature chain tag respective to each level of the tag.
+    Get the (exact) rows of each chain prefix's merged frame, and how many of them are parent rows
+    without child data, from each table's rows and distinct foreign keys only.
     """
-    level2component = {int(c.split("_")[-1]): c for c in tag.split("<")}
-    levels = [int(i) for i in list(level2component.keys())]
+    prefix2n_rows = dict()
+    for tag in sorted(tag_index, key=lambda tag: tag_index[tag]["level"]):  # parents before children
+        parent_feature = tag_index[tag]["parent"]
+        if parent_feature is None:  # root dataframe
+            prefix2n_rows[tag] = (len(table_tag2df[tag]), 0)
+            continue
+
+        # every child row is kept once, as is every parent row without children
+        _, parent_n_empty_rows = prefix2n_rows[parent_feature]
+        n_empty_rows = parent_n_empty_rows + len(table_tag2df[parent_feature]) - \
+            table_tag2df[tag]["FK"].nunique()
+        prefix2n_rows[tag] = (len(table_tag2df[tag]) + n_empty_rows, n_empty_rows)
 
-    level2feature = {level: "<".join([level2component[c_idx]
-                                      for c_idx in range(level, -1, -1)][::-1])
-                     for level in levels}
+    return prefix2n_rows
 
-    levels = list(level2feature.keys())
 
-    # pairing components in reversed order (so deepest is first)
-    # don't need to merge root with itself so [:-1]
-    paired_levels = list(zip(levels[::-1], levels[::-1][1:] + levels[:1]))[:-1]
+def explain_merge(table_tag2df: Dict[str, PandasDataFrame]) -> PandasDataFrame:
+    """
+    Report every chain merge_tables() would create (in its order) without merging: its level, exact rows
+    and estimated memory (the rows times the bytes per row of each table along the chain).
+    """
+    tag_index = build_tag_index(table_tag2df)
+    prefix2n_rows = get_prefix_n_rows(table_tag2df, tag_index)
+    tag2row_bytes = {tag: df.memory_usage(index=False).sum() / max(len(df), 1)
+                     for tag, df in table_tag2df.items()}
 
-    return level2feature, paired_levels
+    chain_tags = [tag for tag in get_tags_by_level(tag_index)
+                  if len(tag_index[tag]["children"]) == 0]
+    return pd.DataFrame({"level": [tag_index[tag]["level"] for tag in chain_tags],
+                         "rows": [prefix2n_rows[tag][0] for tag in chain_tags],
+                         "est_bytes": [int(prefix2n_rows[tag][0] * sum([
+                             tag2row_bytes[chain_tag] for chain_tag in get_chain_tags(tag, tag_index)]))
+                             for tag in chain_tags]},
+                        index=pd.Index(chain_tags, name="chain"))
 
 
-def get_downstream_table_tag(tag: str) -> str:
+# merging atomic tables
+def check_if_tag_has_subtables(tag: str,
+                               tag_index: Dict[str, Dict[str, Any]],
+                               verbose: bool = True) -> bool:
     """
-    Get name of last table given table tag (excluding level info).
+    Skipping tables with subtables to avoid redundant merged outputs.
     """
-    return "_".join(tag.split("<")[-1].split("_")[:-1])
+    if len(tag_index[tag]["children"]) > 0:
+        if verbose:
+            print(f"\u274C skipping {tag} since it has subtables")
+        return True
+    else:
+        if verbose:
+            print(f"\n \u2705 creating table over chain '{tag}'")
+        return False
 
 
 def tidy_merge(
@@ -61,11 +125,11 @@ def tidy_merge(
     """
     Post-process merged table.
     """
-    # these key cols wont be present for consecutive levels since they are
-    # dropped
-    throwaway_key_cols = [c for c in ["PK", "PK_x",
-                                      "PK_y", "FK_y"] if c in list(merged_df)]
-    merged_df.drop(["_merge"] + throwaway_key_cols, axis=1, inplace=True)
+    # the parent primary key and child foreign key were only needed for this
+    # merge; the child primary key links to the next level down
+    throwaway_key_cols = [c for c in ["PK_x", "FK"] if c in list(merged_df)]
+    merged_df.drop(throwaway_key_cols, axis=1, inplace=True)
+    merged_df.rename({"PK_y": "PK"}, axis=1, inplace=True)
 
     # tidying column names
     col2rename = dict()
@@ -76,14 +140,64 @@ def tidy_merge(
                                    [tag + "." + c[:-2]  # leave off _x/_y
                                     for c in cols_with_indicator])))
 
-    # drop the child primary key column (it was only needed for this merge)
-    # the current parent primary key will be the foreign key in the next level
-    col2rename["FK_x"] = "FK"
     merged_df.rename(col2rename, axis=1, inplace=True)
 
     return merged_df
 
 
+def get_dense_keys(df: PandasDataFrame, key_col: str) -> Union[np.ndarray, None]:
+    """
+    Get a key column as integers if it has no nulls (None otherwise).
+    """
+    keys = df[key_col]
+    if keys.isna().any() or not pd.api.types.is_numeric_dtype(keys):
+        return None
+    keys = keys.to_numpy(dtype=np.float64 if pd.api.types.is_float_dtype(keys) else np.int64)
+
+    return keys.astype(np.int64) if np.array_equal(keys, np.floor(keys)) else None
+
+
+def merge_dense_level_pair(parent_df: PandasDataFrame,
+                           child_df: PandasDataFrame) -> Union[PandasDataFrame, None]:
+    """
+    Left merge a dataframe and its child dataframe by position when the parent's (non-null) primary keys
+    are 0..n-1 (in any order), as breakdown_json() gives them (None otherwise).
+
+    Parent rows are gathered by their child rows' foreign keys (parents without child data are kept
+    with empty child columns), giving the rows and columns of a left merge.
+    """
+    has_pk = parent_df["PK"].notna().to_numpy()
+    pks = get_dense_keys(parent_df[has_pk], "PK")
+    fks = get_dense_keys(child_df, "FK")
+    if pks is None or fks is None or (len(pks) > 0 and (
+            pks.min() < 0 or pks.max() >= len(pks) or np.bincount(pks).max() > 1)):
+        return None
+
+    # checking the merge will be clean (all foreign keys are in the parent's
+    # range of primary keys)
+    assert(len(fks) == 0 or (fks.min() >= 0 and fks.max() < len(pks)))
+
+    # each parent row is repeated for each of its child rows (kept once if it
+    # has none), and child rows are taken in order of their parent's row
+    pk2parent_row = np.zeros(len(pks), dtype=np.int64)
+    pk2parent_row[pks] = np.arange(len(pks))
+    n_children = np.zeros(len(parent_df), dtype=np.int64)
+    n_children[has_pk] = np.bincount(fks, minlength=len(pks))[pks]
+    parent_rows = np.repeat(np.arange(len(parent_df)), np.maximum(n_children, 1))
+    child_rows = np.full(len(parent_rows), -1)
+    child_rows[np.repeat(n_children > 0, np.maximum(n_children, 1))] = np.argsort(
+        pk2parent_row[fks], kind="stable")
+
+    # suffixes for columns in both dfs (as in a merge)
+    shared_cols = set(parent_df.columns) & set(child_df.columns)
+    parent_part = parent_df.take(parent_rows).reset_index(drop=True)
+    parent_part.columns = [c + "_x" if c in shared_cols else c for c in parent_df.columns]
+    child_part = child_df.reset_index(drop=True).reindex(child_rows).reset_index(drop=True)
+    child_part.columns = [c + "_y" if c in shared_cols else c for c in child_df.columns]
+
+    return pd.concat([parent_part, child_part], axis=1)
+
+
 def merge_level_pair(
         parent_df: PandasDataFrame,
         child_df: PandasDataFrame,
@@ -91,71 +205,325 @@ def merge_level_pair(
         child_tag: str) -> PandasDataFrame:
     """
     Perform a single merge for a dataframe and its child dataframe.
+
+    Dense keys (see merge_dense_level_pair()) are merged by position, other keys with a hash merge.
     """
-    merged_df = parent_df.merge(child_df, left_on="PK", right_on="FK",
-                                how="outer", indicator=True)
+    merged_df = merge_dense_level_pair(parent_df, child_df)
+    if merged_df is not None:
+        return merged_df
 
-    # checking the merge was clean (everything in right should have linked to left)
+    # checking the merge will be clean (everything in right should link to left)
     # not necesarily otherway around since some rows in parent table didn't
     # have child data)
-    assert(dict(merged_df["_merge"].value_counts())["right_only"] == 0)
+    assert(child_df["FK"].isin(parent_df["PK"]).all())
+
+    # a left merge keeps parent rows in order (those without child data
+    # included), each followed by its child rows
+    merged_df = parent_df.merge(child_df, left_on="PK", right_on="FK", how="left")
 
     return merged_df
 
 
+def merge_chain_prefix(tag: str,
+                       table_tag2df: Dict[str, PandasDataFrame],
+                       prefix2df: Dict[str, PandasDataFrame],
+                       tag_index: Dict[str, Dict[str, Any]]) -> PandasDataFrame:
+    """
+    Merge the dataframes along a chain from the root down to the given tag, reusing (and caching)
+    the merged frames of the chain's prefixes.
+
+    The merged frame keeps the last table's primary key to merge the next level on.
+    """
+    if tag in prefix2df:
+        return prefix2df[tag]
+    parent_feature = tag_index[tag]["parent"]
+    if parent_feature is None:  # root dataframe
+        return table_tag2df[tag]
+    parent_df = merge_chain_prefix(parent_feature, table_tag2df, prefix2df, tag_index)
+    prefix2df[tag] = merge_child_table(tag, parent_df, table_tag2df, tag_index)
+
+    return prefix2df[tag]
+
+
+def merge_child_table(tag: str,
+                      parent_df: PandasDataFrame,
+                      table_tag2df: Dict[str, PandasDataFrame],
+                      tag_index: Dict[str, Dict[str, Any]]) -> PandasDataFrame:
+    """
+    Merge a table onto the merged frame of its parent's chain prefix.
+    """
+    # additional tags to mark any columns duplicated over the two dfs
+    child_tag = tag_index[tag]["name"]
+    parent_tag = tag_index[tag_index[tag]["parent"]]["name"]
+
+    # merging and tidying
+    merged_df = merge_level_pair(parent_df, table_tag2df[tag], parent_tag, child_tag)
+
+    return tidy_merge(child_tag, parent_tag, merged_df)
+
+
+def get_chain_col_names(tag: str,
+                        table_tag2df: Dict[str, PandasDataFrame],
+                        tag_index: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Get the column names of a merged chain, as given by merging up from its deepest table
+    (at each level, columns found in both the parent table and everything merged below it are
+    prefixed with their table name, see tidy_merge()).
+    """
+    col_names = list(table_tag2df[tag])
+    chain_tags = get_chain_tags(tag, tag_index)
+    for child_feature, parent_feature in zip(chain_tags[:0:-1], chain_tags[-2::-1]):
+        child_tag = tag_index[child_feature]["name"]
+        parent_tag = tag_index[parent_feature]["name"]
+
+        # suffixes given by the merge to columns in both dfs
+        parent_col_names = list(table_tag2df[parent_feature])
+        shared_col_names = set(parent_col_names) & set(col_names)
+        col_names = [c + "_x" if c in shared_col_names else c for c in parent_col_names] + \
+                    [c + "_y" if c in shared_col_names else c for c in col_names]
+
+        # tidying
+        col_names = [c for c in col_names if c not in ["PK", "PK_x", "PK_y", "FK_y"]]
+        col_names = ["FK" if c == "FK_x" else
+                     parent_tag + "." + c[:-2] if c.endswith("_x") else
+                     child_tag + "." + c[:-2] if c.endswith("_y") else c
+                     for c in col_names]
+
+    return [c for c in col_names if c != "FK"]
+
+
 def merge_tag_chain(tag: str,
                     table_tag2df: Dict[str,
-                                       PandasDataFrame]) -> PandasDataFrame:
-    """
-    Merge multiple dataframes by following the component chain from right
-    (deepest level) to left (root dataframe).
+                                       PandasDataFrame],
+                    prefix2df: Dict[str, PandasDataFrame] = None,
+                    tag_index: Dict[str, Dict[str, Any]] = None) -> PandasDataFrame:
     """
-    # building the feature chains up to this level for each item in the pair
-    deepest = True
-    level2feature, paired_levels = get_level_items(tag)
-    for child__parent in paired_levels:
-        child_feature, parent_feature = level2feature[child__parent[0]
-                                                      ], level2feature[child__parent[1]]
+    Merge multiple dataframes by following the component chain from left
+    (root dataframe) to right (deepest level).
 
-        # additional tags to mark any columns duplicated over the two dfs
-        child_tag = get_downstream_table_tag(level2feature[child__parent[0]])
-        parent_tag = get_downstream_table_tag(level2feature[child__parent[1]])
+    Merged chain prefixes are cached in prefix2df (if given) for other chains sharing them.
+    A tag index (see build_tag_index()) is built from the tables if not given.
+    """
+    tag_index = build_tag_index(table_tag2df) if tag_index is None else tag_index
+    merged_df = merge_chain_prefix(tag, table_tag2df,
+                                   dict() if prefix2df is None else prefix2df, tag_index)
 
-        if deepest:
-            child_df = table_tag2df[child_feature]
-            deepest = False  # for next pass
-        # else the child df is everything merged thus far
+    return finish_merged_chain(tag, merged_df, table_tag2df, tag_index)
 
-        # merging and tidying
-        child_df = merge_level_pair(
-            table_tag2df[parent_feature],
-            child_df, parent_tag, child_tag)
-        child_df = tidy_merge(child_tag, parent_tag, child_df)
 
+def finish_merged_chain(tag: str,
+                        merged_df: PandasDataFrame,
+                        table_tag2df: Dict[str, PandasDataFrame],
+                        tag_index: Dict[str, Dict[str, Any]]) -> PandasDataFrame:
+    """
+    Drop the last key of a chain merged down to its deepest table and name its columns.
+    """
     # don't need after merge through this level is done
-    child_df.drop(["FK"], axis=1, inplace=True)
-    return child_df  # the fully merged df when done iterating through all levels
+    merged_df = merged_df.drop(["PK"], axis=1)
 
+    # columns are in the same places merging up or down the chain, but may
+    # be named differently where tables share names
+    merged_df.columns = get_chain_col_names(tag, table_tag2df, tag_index)
 
-def merge_tables(table_tag2df: Dict[str,
-                                    PandasDataFrame]) -> Dict[str,
-                                                              PandasDataFrame]:
+    return merged_df
+
+
+# merging chains in chunks
+def get_parent_positions(parent_df: PandasDataFrame, child_df: PandasDataFrame) -> np.ndarray:
     """
-    Merge atomic tables together to create tables that exhaust all chains.
+    Get the row position of each child row's parent row.
+    """
+    return pd.Index(parent_df["PK"]).get_indexer(child_df["FK"])
+
+
+def get_chain_chunk_ids(tag: str,
+                        table_tag2df: Dict[str, PandasDataFrame],
+                        tag_index: Dict[str, Dict[str, Any]],
+                        chunk_rows: int) -> Dict[str, np.ndarray]:
+    """
+    Assign the rows of each table along a chain to chunks: consecutive root rows are grouped into
+    chunks of about chunk_rows merged rows (more only if a single root row gives more), and every other
+    row goes with its root row.
+    """
+    chain_tags = get_chain_tags(tag, tag_index)
+    tag2parent_positions = {child_feature: get_parent_positions(table_tag2df[parent_feature],
+                                                                table_tag2df[child_feature])
+                            for parent_feature, child_feature in zip(chain_tags, chain_tags[1:])}
+
+    # merged rows given by each row, counted from the deepest table up (rows
+    # without children are kept once)
+    n_rows = np.ones(len(table_tag2df[tag]))
+    for child_feature, parent_feature in zip(chain_tags[:0:-1], chain_tags[-2::-1]):
+        n_rows = np.maximum(np.bincount(tag2parent_positions[child_feature], weights=n_rows,
+                                        minlength=len(table_tag2df[parent_feature])), 1)
+
+    # chunks of root rows by where their merged rows end, then down the chain
+    _, chunk_ids = np.unique((np.cumsum(n_rows) - 1) // chunk_rows, return_inverse=True)
+    tag2chunk_ids = {chain_tags[0]: chunk_ids}
+    for parent_feature, child_feature in zip(chain_tags, chain_tags[1:]):
+        tag2chunk_ids[child_feature] = tag2chunk_ids[parent_feature][tag2parent_positions[child_feature]]
+
+    return tag2chunk_ids
+
+
+def rebase_chunk_keys(chunk_tag2df: Dict[str, PandasDataFrame],
+                      chain_tags: List[str]) -> Dict[str, PandasDataFrame]:
     """
-    # looping through levels and tags per each level and building merged frames
-    tag2max_level = {tag: len(tag.split("<")) - 1 for tag in table_tag2df}
-    tag2df, deepest_level = dict(), max(tag2max_level.values())
-    for level_idx in range(deepest_level, 0, -1):
+    Renumber the keys of a chunk of a chain's tables as 0..n-1 so they're merged by position.
+    """
+    rebased_tag2df = {chain_tags[0]: chunk_tag2df[chain_tags[0]].assign(
+        PK=np.arange(len(chunk_tag2df[chain_tags[0]])))}
+    for parent_feature, child_feature in zip(chain_tags, chain_tags[1:]):
+        child_df = chunk_tag2df[child_feature]
+        rebased_tag2df[child_feature] = child_df.assign(
+            PK=np.arange(len(child_df)),
+            FK=get_parent_positions(chunk_tag2df[parent_feature], child_df))
+
+    return rebased_tag2df
 
-        # for each tag at this level, if it doesn't have subtables it's the end
-        # of a merge chain
-        for tag in [tag for tag, level in tag2max_level.items()
-                    if level == level_idx]:
 
-            if check_if_tag_has_subtables(tag, tag2max_level):
-                continue
+def iter_merge_tag_chain(tag: str,
+                         table_tag2df: Dict[str, PandasDataFrame],
+                         chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                         tag_index: Dict[str, Dict[str, Any]] = None) -> Iterator[PandasDataFrame]:
+    """
+    Merge a chain in chunks of consecutive root rows (see get_chain_chunk_ids()), yielding merged
+    chunks that append up to merge_tag_chain()'s table (index included), so a chain of any size can be
+    written out (e.g. by sink.write_parquet_tables()) holding one chunk at a time.
 
-            tag2df[tag] = merge_tag_chain(tag, table_tag2df)
+    Columns of a chunk whose rows all have child data may keep dtypes the whole table upcasts.
+    """
+    tag_index = build_tag_index(table_tag2df) if tag_index is None else tag_index
+    chain_tags = get_chain_tags(tag, tag_index)
+    tag2chunk_ids = get_chain_chunk_ids(tag, table_tag2df, tag_index, chunk_rows)
+
+    # each table's rows grouped by chunk (in order within a chunk), with a
+    # single (empty) chunk if there are no root rows
+    root_chunk_ids = tag2chunk_ids[chain_tags[0]]
+    n_chunks = root_chunk_ids.max() + 1 if len(root_chunk_ids) > 0 else 1
+    tag2chunk_rows = dict()
+    for chain_tag in chain_tags:
+        chunk_ids = tag2chunk_ids[chain_tag]
+        rows = np.argsort(chunk_ids, kind="stable")
+        bounds = np.searchsorted(chunk_ids[rows], np.arange(n_chunks + 1))
+        tag2chunk_rows[chain_tag] = [rows[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    offset = 0
+    for chunk_idx in range(n_chunks):
+        chunk_tag2df = rebase_chunk_keys({chain_tag: table_tag2df[chain_tag].iloc[tag2chunk_rows[chain_tag][chunk_idx]]
+                                          for chain_tag in chain_tags}, chain_tags)
+        merged_df = merge_tag_chain(tag, chunk_tag2df, tag_index=tag_index)
+        merged_df.index = pd.RangeIndex(offset, offset + len(merged_df))
+        offset += len(merged_df)
+        yield merged_df
+
+
+# merging all chains
+def serial_merge_tables(table_tag2df: Dict[str, PandasDataFrame],
+                        tag_index: Dict[str, Dict[str, Any]],
+                        chain_tags: List[str]) -> Dict[str, PandasDataFrame]:
+    """
+    Merge chains one after another, keeping merged chain prefixes while chains left to merge share them.
+    """
+    # merged chain prefixes are kept while chains left to merge share them
+    prefix2n_chains = dict()
+    for tag in chain_tags:
+        for prefix in get_chain_tags(tag, tag_index)[1:]:
+            prefix2n_chains[prefix] = prefix2n_chains.get(prefix, 0) + 1
+    prefix2df, tag2df = dict(), dict()
+
+    for tag in chain_tags:
+        tag2df[tag] = merge_tag_chain(tag, table_tag2df, prefix2df, tag_index)
+        for prefix in get_chain_tags(tag, tag_index)[1:]:
+            prefix2n_chains[prefix] -= 1
+            if prefix2n_chains[prefix] == 0:
+                prefix2df.pop(prefix, None)
 
     return tag2df
+
+
+def parallel_merge_tables(table_tag2df: Dict[str, PandasDataFrame],
+                          tag_index: Dict[str, Dict[str, Any]],
+                          chain_tags: List[str],
+                          workers: int) -> Dict[str, PandasDataFrame]:
+    """
+    Merge chains on a thread pool, one level at a time: each chain prefix is merged once (onto its
+    parent's) and fanned out to the tables below it, whose prefixes make up the next level.
+
+    Threads share the merged frames without copying them; only the current level's prefixes are kept.
+    """
+    needed_tags = {prefix for tag in chain_tags for prefix in get_chain_tags(tag, tag_index)}
+    parent2df = {tag: table_tag2df[tag] for tag, node in tag_index.items()
+                 if node["level"] == 0 and tag in needed_tags}
+    tag2df = dict()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(parent2df) > 0:
+            level_tags = [child_tag for tag in parent2df
+                          for child_tag in tag_index[tag]["children"] if child_tag in needed_tags]
+            parent_dfs = [parent2df[tag_index[tag]["parent"]] for tag in level_tags]
+            prefix2df = dict(zip(level_tags, executor.map(
+                lambda tag, parent_df: merge_child_table(tag, parent_df, table_tag2df, tag_index),
+                level_tags, parent_dfs)))
+
+            # chains ending at this level are finished, the other prefixes are
+            # the parents of the next level
+            level_chain_tags = [tag for tag in level_tags if len(tag_index[tag]["children"]) == 0]
+            tag2df.update(zip(level_chain_tags, executor.map(
+                lambda tag: finish_merged_chain(tag, prefix2df[tag], table_tag2df, tag_index),
+                level_chain_tags)))
+            parent2df = {tag: merged_df for tag, merged_df in prefix2df.items()
+                         if tag not in tag2df}
+
+    return {tag: tag2df[tag] for tag in chain_tags}
+
+
+def merge_tables(table_tag2df: Dict[str,
+                                    PandasDataFrame],
+                 verbose: bool = True,
+                 workers: int = 1,
+                 max_rows: int = None,
+                 over_max_rows: str = "skip") -> Dict[str,
+                                                      Union[PandasDataFrame, Iterator[PandasDataFrame]]]:
+    """
+    Merge atomic tables together to create tables that exhaust all chains.
+
+    Tags are parsed once into an index (see build_tag_index()). Set verbose=False to not print
+    the chains as they are merged (or skipped). With more than one worker, chains are merged on a
+    thread pool (see parallel_merge_tables()), giving the same tables in the same order.
+    Chains that would have more than max_rows rows (see explain_merge()) are skipped, or with
+    over_max_rows="stream" given as generators of chunks of about max_rows rows (see iter_merge_tag_chain()).
+    """
+    if over_max_rows not in ["skip", "stream"]:
+        raise ValueError(f"over_max_rows should be 'skip' or 'stream', not '{over_max_rows}'")
+    tag_index = build_tag_index(table_tag2df)
+    prefix2n_rows = get_prefix_n_rows(table_tag2df, tag_index) if max_rows is not None else dict()
+
+    # looping through tags deepest level first, if a tag doesn't have subtables
+    # it's the end of a merge chain
+    chain_tags, tag2chunks = list(), dict()
+    for tag in get_tags_by_level(tag_index):
+
+        if len(tag_index[tag]["children"]) == 0 and max_rows is not None and \
+                prefix2n_rows[tag][0] > max_rows:
+            if over_max_rows == "stream":
+                if verbose:
+                    print(f"\n \u2705 streaming table over chain '{tag}' ({prefix2n_rows[tag][0]} rows)")
+                tag2chunks[tag] = iter_merge_tag_chain(tag, table_tag2df, max_rows, tag_index)
+            elif verbose:
+                print(f"\u274C skipping {tag} since it would have {prefix2n_rows[tag][0]} rows")
+            continue
+
+        if check_if_tag_has_subtables(tag, tag_index, verbose):
+            continue
+
+        chain_tags.append(tag)
+
+    if workers > 1:
+        tag2df = parallel_merge_tables(table_tag2df, tag_index, chain_tags, workers)
+    else:
+        tag2df = serial_merge_tables(table_tag2df, tag_index, chain_tags)
+
+    # streamed chains in their place among the merged ones
+    tag2df.update(tag2chunks)
+    return {tag: tag2df[tag] for tag in get_tags_by_level(tag_index) if tag in tag2df}
+
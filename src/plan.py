@@ -0,0 +1,87 @@
+"""
+Compile breakdown plans once (from a sample of records or an explicit schema) and reuse them on new batches.
+
+A plan holds the tag tree of the atomic tables, and for each table the columns it has seen and the order
+its object/array columns get expanded in, so breaking down a batch of the same shape skips checking types.
+Paths the plan hasn't seen are discovered as usual ('breakdown.py') and reported.
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import copy
+import json
+from typing import Union, List, Dict, Any, TypeVar, Tuple
+
+# module
+try:  # imported as part of the package
+    from . import breakdown
+except ImportError:  # imported with 'src/' on the path (e.g. tests)
+    import breakdown
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+
+
+# compiling plans
+def compile_breakdown_plan(sample: Union[List[Dict[str, Any]], Dict[str, Any]] = None,
+                           schema: Dict[str, Any] = None,
+                           endpoint_name: str = "root",
+                           drop_empty: bool = False) -> Dict[str, Any]:
+    """
+    Compile a breakdown plan from a sample of records or an explicit schema.
+
+    A schema is an example record with type names for values and a list holding the item schema for arrays,
+    e.g. {"id": "int", "people": [{"name": "str", "interests": ["str"]}]}.
+    """
+    if (sample is None) == (schema is None):
+        raise ValueError("give either a sample or a schema to compile a plan from")
+
+    table_tag2plan = dict()
+    breakdown.native_breakdown_json([schema] if sample is None else sample,
+                                    endpoint_name, drop_empty, table_tag2plan)
+
+    return {"endpoint_name": endpoint_name,
+            "drop_empty": drop_empty,
+            "tables": table_tag2plan}
+
+
+def save_breakdown_plan(plan: Dict[str, Any], path: str):
+    """
+    Save a breakdown plan to a json file.
+    """
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=2)
+
+
+def load_breakdown_plan(path: str) -> Dict[str, Any]:
+    """
+    Load a breakdown plan saved with save_breakdown_plan().
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+# executing plans
+def execute_breakdown_plan(data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                           plan: Dict[str, Any],
+                           update: bool = False,
+                           check_leaves: bool = False) -> Tuple[Dict[str, PandasDataFrame], List[Tuple[str, str]]]:
+    """
+    Breakdown json data following a compiled plan.
+
+    Planned expansions are done without checking types, and only the columns the plan hasn't seen are checked
+    and broken down as usual (see 'breakdown.py' walk_table()). Returns the atomic tables and the (table tag,
+    column) paths the plan hadn't seen. With update=True those paths are added to the plan for the next batches.
+
+    With check_leaves=True the columns the plan saw are checked too, for records whose shape may drift (e.g. a
+    simple value turned into an array or an object into an array); those columns are reported as unseen paths.
+    """
+    plan = plan if update else copy.deepcopy(plan)
+    unseen_paths = list()
+    table_tag2df = breakdown.native_breakdown_json(data, plan["endpoint_name"], plan["drop_empty"],
+                                                   plan["tables"], unseen_paths, check_leaves)
+
+    return table_tag2df, unseen_paths
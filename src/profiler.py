@@ -0,0 +1,464 @@
+"""
+Profile the schema of streams of JSON records with bounded memory.
+
+Records are walked as in 'dev/explore.py' (compile_nested_keys()), but instead of keeping every value,
+each path (e.g. 'people[].name') keeps fixed-size statistics: value type counts, nulls, an approximate
+distinct count (HyperLogLog sketch), min/max and a reservoir sample of example values.
+
+Profiles merge associatively, so many files can be profiled in separate processes and the partial
+profiles reduced into one (with a key tree of counts, as the per-document trees in 'dev/explore.py').
+Per-file profiles can be cached on disk, so unchanged files aren't profiled again.
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import os
+import glob
+import math
+import time
+import pickle
+import sqlite3
+import random
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, List, Dict, Any, TypeVar, Tuple, Iterable
+
+# data science
+import numpy as np
+import pandas as pd
+
+# module
+try:  # imported as part of the package
+    from . import stream
+except ImportError:  # imported with 'src/' on the path (e.g. tests)
+    import stream
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+DEFAULT_N_EXAMPLES = 5  # example values kept per path
+DEFAULT_HLL_PRECISION = 10  # 2**precision one-byte registers per path (~3% distinct count error)
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2  # size cap of a profile cache
+HASH_BLOCK_SIZE = 1 << 20  # bytes read at a time when hashing a file's content
+TYPE_NAMES = {dict: "object", list: "array", type(None): "null", bool: "bool",
+              int: "int", float: "float", str: "str"}
+
+
+# approximate distinct counts
+def hash_value(value: Any, type_name: str) -> int:
+    """
+    Get a 64-bit hash of a simple value that's the same in every process (unlike hash()).
+    """
+    text = f"{type_name}:{value!r}"
+
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def get_hll_position(hash_: int, precision: int) -> Tuple[int, int]:
+    """
+    Get the HyperLogLog register of a 64-bit hash and its rank (position of the first set bit after the
+    register bits).
+    """
+    n_rest_bits = 64 - precision
+    rest = hash_ & ((1 << n_rest_bits) - 1)
+
+    return hash_ >> n_rest_bits, n_rest_bits - rest.bit_length() + 1
+
+
+def estimate_hll_count(registers: bytearray) -> int:
+    """
+    Estimate the distinct count of a HyperLogLog sketch (with linear counting for small counts).
+    """
+    n_registers = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / n_registers)
+    estimate = alpha * n_registers ** 2 / sum([2.0 ** -rank for rank in registers])
+    n_zeros = registers.count(0)
+    if estimate <= 2.5 * n_registers and n_zeros > 0:
+        estimate = n_registers * math.log(n_registers / n_zeros)
+
+    return round(estimate)
+
+
+# profiling
+def get_type_name(value: Any) -> str:
+    """
+    Get the json type name of a value ('object', 'array', 'null', 'bool', 'int', 'float' or 'str').
+    """
+    return TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+def get_path(parent_path: str, key: Any) -> str:
+    """
+    Get the path of an object's key.
+    """
+    return str(key) if parent_path == "" else f"{parent_path}.{key}"
+
+
+class SchemaProfile:
+    """
+    Bounded-memory profile of the paths in a stream of json records.
+
+    Each path holds a fixed amount of state however many records are seen: value counts by type, a
+    HyperLogLog sketch of distinct simple values, min/max (of numbers, or of strings if there are no
+    numbers) and a reservoir sample of example values. Array items share their array's path plus '[]'.
+    """
+
+    def __init__(self,
+                 n_examples: int = DEFAULT_N_EXAMPLES,
+                 hll_precision: int = DEFAULT_HLL_PRECISION,
+                 seed: int = 0):
+        self.n_examples = n_examples
+        self.hll_precision = hll_precision
+        self.random = random.Random(seed)
+        self.n_records = 0
+        self.path2stats = dict()
+
+    def get_stats(self, path: str, parent_path: str = None, key: str = None) -> Dict[str, Any]:
+        """
+        Get (or start) the statistics of a path (a key of its parent path).
+        """
+        if path not in self.path2stats:
+            self.path2stats[path] = {"parent": parent_path,
+                                     "key": path if key is None else key,
+                                     "count": 0,
+                                     "types": dict(),
+                                     "registers": bytearray(1 << self.hll_precision),
+                                     "n_values": 0,
+                                     "bounds": dict(),
+                                     "examples": list()}
+
+        return self.path2stats[path]
+
+    def update_value(self, stats: Dict[str, Any], value: Any, type_name: str):
+        """
+        Add a simple (non-null) value to a path's distinct count sketch, bounds and examples.
+        """
+        register, rank = get_hll_position(hash_value(value, type_name), self.hll_precision)
+        stats["registers"][register] = max(stats["registers"][register], rank)
+
+        if type_name in ["int", "float", "str"]:
+            bounds_type = "str" if type_name == "str" else "number"
+            bounds = stats["bounds"].setdefault(bounds_type, [value, value])
+            bounds[0], bounds[1] = min(bounds[0], value), max(bounds[1], value)
+
+        # reservoir sampling (each value is kept with equal probability)
+        stats["n_values"] += 1
+        if len(stats["examples"]) < self.n_examples:
+            stats["examples"].append(value)
+        else:
+            example_idx = int(self.random.random() * stats["n_values"])
+            if example_idx < self.n_examples:
+                stats["examples"][example_idx] = value
+
+    def walk(self, value: Any, path: str, parent_path: str = None, key: str = None):
+        """
+        Add a value (and everything nested in it) found at a key of a parent path.
+        """
+        stats = self.get_stats(path, parent_path, key)
+        type_name = get_type_name(value)
+        stats["count"] += 1
+        stats["types"][type_name] = stats["types"].get(type_name, 0) + 1
+
+        if isinstance(value, dict):
+            for child_key, child_value in value.items():
+                self.walk(child_value, get_path(path, child_key), path, str(child_key))
+        elif isinstance(value, list):
+            for item in value:
+                self.walk(item, path + "[]", path, "[]")
+        elif value is not None:
+            self.update_value(stats, value, type_name)
+
+    def update(self, record: Dict[str, Any]):
+        """
+        Add a record to the profile.
+        """
+        self.n_records += 1
+        if isinstance(record, dict):
+            for key, value in record.items():
+                self.walk(value, get_path("", key), None, str(key))
+        else:
+            self.walk(record, "")
+
+    def update_records(self, records: Iterable[Dict[str, Any]]) -> "SchemaProfile":
+        """
+        Add records (e.g. a stream from 'stream.py') to the profile.
+        """
+        for record in records:
+            self.update(record)
+
+        return self
+
+    def merge_examples(self, stats: Dict[str, Any], other_stats: Dict[str, Any]) -> List[Any]:
+        """
+        Sample the examples of two reservoirs as one reservoir over all their values (each reservoir's
+        examples stand for its n_values).
+        """
+        examples, other_examples = list(stats["examples"]), list(other_stats["examples"])
+        self.random.shuffle(examples)
+        self.random.shuffle(other_examples)
+
+        # draw (without replacement) which reservoir each merged example comes from
+        n_left, other_n_left = stats["n_values"], other_stats["n_values"]
+        n_taken = 0
+        for _ in range(min(self.n_examples, n_left + other_n_left)):
+            if self.random.random() * (n_left + other_n_left) < n_left:
+                n_left, n_taken = n_left - 1, n_taken + 1
+            else:
+                other_n_left -= 1
+
+        return examples[:n_taken] + other_examples[:min(self.n_examples, len(examples) + len(other_examples))
+                                                   - n_taken]
+
+    def update_profile(self, other: "SchemaProfile") -> "SchemaProfile":
+        """
+        Merge another profile into this one in place, as if this one had seen its records too (paths first
+        seen in the other profile come last).
+
+        Merging is associative: counts add up, sketches keep their highest ranks, bounds widen and the
+        examples are a reservoir sample over both.
+        """
+        if (other.n_examples, other.hll_precision) != (self.n_examples, self.hll_precision):
+            raise ValueError("Only profiles with the same n_examples and hll_precision can be merged.")
+
+        self.n_records += other.n_records
+        for path, other_stats in other.path2stats.items():
+            stats = self.path2stats.get(path)
+            if stats is None:
+                self.path2stats[path] = {**other_stats,
+                                         "types": dict(other_stats["types"]),
+                                         "registers": bytearray(other_stats["registers"]),
+                                         "bounds": {bounds_type: list(bounds)
+                                                    for bounds_type, bounds in other_stats["bounds"].items()},
+                                         "examples": list(other_stats["examples"])}
+                continue
+
+            stats["count"] += other_stats["count"]
+            for type_name, count in other_stats["types"].items():
+                stats["types"][type_name] = stats["types"].get(type_name, 0) + count
+            for bounds_type, (lo, hi) in other_stats["bounds"].items():
+                type_bounds = stats["bounds"].setdefault(bounds_type, [lo, hi])
+                type_bounds[0], type_bounds[1] = min(type_bounds[0], lo), max(type_bounds[1], hi)
+            registers = np.frombuffer(stats["registers"], dtype=np.uint8)
+            np.maximum(registers, np.frombuffer(other_stats["registers"], dtype=np.uint8), out=registers)
+            stats["examples"] = self.merge_examples(stats, other_stats)
+            stats["n_values"] += other_stats["n_values"]
+
+        return self
+
+    def merge(self, other: "SchemaProfile") -> "SchemaProfile":
+        """
+        Merge two profiles into a new one, as if it had seen the records of both (see update_profile()).
+        """
+        merged = SchemaProfile(self.n_examples, self.hll_precision, self.random.getrandbits(32))
+
+        return merged.update_profile(self).update_profile(other)
+
+    def key_tree(self) -> Dict[str, Any]:
+        """
+        Get the paths as a tree of keys ('[]' for array items), each with its count and child keys.
+        """
+        path2node = dict()
+        tree = dict()
+        for path, stats in self.path2stats.items():
+            path2node[path] = {"count": stats["count"], "children": dict()}
+            siblings = tree if stats["parent"] is None else path2node[stats["parent"]]["children"]
+            siblings[stats["key"]] = path2node[path]
+
+        return tree
+
+    def summary(self) -> PandasDataFrame:
+        """
+        Summarize each path (in the order first seen): values seen, null rate, type counts, approximate
+        distinct (simple) values, min/max and example values.
+        """
+        rows = list()
+        for path, stats in self.path2stats.items():
+            bounds = stats["bounds"].get("number", stats["bounds"].get("str", [None, None]))
+            rows.append({"path": path,
+                         "count": stats["count"],
+                         "null_rate": stats["types"].get("null", 0) / stats["count"],
+                         "types": dict(stats["types"]),
+                         "distinct": estimate_hll_count(stats["registers"]) if stats["n_values"] > 0 else 0,
+                         "min": bounds[0],
+                         "max": bounds[1],
+                         "examples": list(stats["examples"])})
+
+        return pd.DataFrame(rows, columns=["path", "count", "null_rate", "types", "distinct",
+                                           "min", "max", "examples"]).set_index("path")
+
+
+def profile_records(records: Iterable[Dict[str, Any]],
+                    n_examples: int = DEFAULT_N_EXAMPLES,
+                    hll_precision: int = DEFAULT_HLL_PRECISION) -> SchemaProfile:
+    """
+    Profile a stream of json records (see SchemaProfile).
+    """
+    return SchemaProfile(n_examples, hll_precision).update_records(records)
+
+
+# caching file profiles
+def hash_file(path: str) -> str:
+    """
+    Get a hash of a file's content.
+    """
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(functools.partial(f.read, HASH_BLOCK_SIZE), b""):
+            content_hash.update(block)
+
+    return content_hash.hexdigest()
+
+
+class ProfileCache:
+    """
+    On-disk cache (a sqlite file) of file profiles, keyed by the file's path, size and modification time
+    (and content hash, if hash_content), so a cache hit costs a stat per file.
+
+    Once the cached profiles take more than max_bytes, the least recently used ones are evicted.
+    """
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = DEFAULT_CACHE_BYTES,
+                 hash_content: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS profiles (path TEXT PRIMARY KEY, "
+                                "fingerprint TEXT, n_bytes INTEGER, last_used INTEGER, profile BLOB)")
+
+    def get_fingerprint(self, path: str, n_examples: int, hll_precision: int) -> str:
+        """
+        Get the fingerprint a file's cached profile must match (its size, modification time, content hash
+        and the profile's settings).
+        """
+        stat = os.stat(path)
+        content_hash = hash_file(path) if self.hash_content else ""
+
+        return f"{stat.st_size}:{stat.st_mtime_ns}:{content_hash}:{n_examples}:{hll_precision}"
+
+    def get(self, path: str, fingerprint: str) -> Union[SchemaProfile, None]:
+        """
+        Get the cached profile of a file (None if it isn't cached or the file changed).
+        """
+        path = os.path.abspath(path)
+        row = self.connection.execute("SELECT fingerprint, profile FROM profiles WHERE path = ?",
+                                      (path,)).fetchone()
+        if row is None or row[0] != fingerprint:
+            return None
+
+        self.connection.execute("UPDATE profiles SET last_used = ? WHERE path = ?", (time.time_ns(), path))
+
+        return pickle.loads(row[1])
+
+    def put(self, path: str, fingerprint: str, profile: SchemaProfile):
+        """
+        Cache the profile of a file (kept after the next flush() only if it's within max_bytes).
+        """
+        blob = pickle.dumps(profile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                                (os.path.abspath(path), fingerprint, len(blob), time.time_ns(), blob))
+
+    def flush(self):
+        """
+        Evict the least recently used profiles until the cache fits max_bytes, then commit.
+        """
+        with self.connection:
+            n_bytes = self.connection.execute("SELECT COALESCE(SUM(n_bytes), 0) FROM profiles").fetchone()[0]
+            if n_bytes > self.max_bytes:
+                rows = self.connection.execute("SELECT path, n_bytes FROM profiles ORDER BY last_used").fetchall()
+                for path, profile_n_bytes in rows:
+                    if n_bytes <= self.max_bytes:
+                        break
+                    self.connection.execute("DELETE FROM profiles WHERE path = ?", (path,))
+                    n_bytes -= profile_n_bytes
+
+    def close(self):
+        """
+        Close the sqlite file.
+        """
+        self.connection.close()
+
+
+# profiling files
+def read_records(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read the records of a json file (the items of a top-level array, or the document itself) or of a
+    newline-delimited json file ('.ndjson'/'.jsonl'), one record at a time.
+    """
+    if path.endswith((".ndjson", ".jsonl")):
+        return (record for chunk in stream.read_ndjson_chunks(path) for record in chunk)
+
+    return stream.iter_json_array(path)
+
+
+def profile_file(path: str,
+                 n_examples: int = DEFAULT_N_EXAMPLES,
+                 hll_precision: int = DEFAULT_HLL_PRECISION) -> SchemaProfile:
+    """
+    Profile the records of a json file (see read_records()).
+    """
+    return profile_records(read_records(path), n_examples, hll_precision)
+
+
+def profile_files(paths: List[str],
+                  workers: int = 1,
+                  n_examples: int = DEFAULT_N_EXAMPLES,
+                  hll_precision: int = DEFAULT_HLL_PRECISION,
+                  cache: ProfileCache = None) -> SchemaProfile:
+    """
+    Profile json files (in separate processes with workers > 1) and merge their profiles into one (in place,
+    see SchemaProfile.update_profile()).
+
+    With a cache, only files without an up-to-date cached profile are profiled (and then cached).
+    """
+    if len(paths) == 0:
+        return SchemaProfile(n_examples, hll_precision)
+
+    path2profile = dict()
+    path2fingerprint = dict()
+    if cache is not None:
+        for path in paths:
+            path2fingerprint[path] = cache.get_fingerprint(path, n_examples, hll_precision)
+            profile = cache.get(path, path2fingerprint[path])
+            if profile is not None:
+                path2profile[path] = profile
+
+    missing_paths = [path for path in dict.fromkeys(paths) if path not in path2profile]
+    profile_path = functools.partial(profile_file, n_examples=n_examples, hll_precision=hll_precision)
+    if workers > 1 and len(missing_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            profiles = executor.map(profile_path, missing_paths,
+                                    chunksize=max(1, len(missing_paths) // (4 * workers)))
+            path2profile.update(zip(missing_paths, profiles))
+    else:
+        path2profile.update(zip(missing_paths, map(profile_path, missing_paths)))
+
+    if cache is not None:
+        for path in missing_paths:
+            cache.put(path, path2fingerprint[path], path2profile[path])
+        cache.flush()
+
+    profile = SchemaProfile(n_examples, hll_precision)
+    for path in paths:
+        profile.update_profile(path2profile[path])
+
+    return profile
+
+
+def profile_directory(directory: str,
+                      pattern: str = "*.json",
+                      workers: int = 1,
+                      n_examples: int = DEFAULT_N_EXAMPLES,
+                      hll_precision: int = DEFAULT_HLL_PRECISION,
+                      cache: ProfileCache = None) -> SchemaProfile:
+    """
+    Profile the json files in a directory matching a glob pattern (in name order, see profile_files()).
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+
+    return profile_files(paths, workers, n_examples, hll_precision, cache)
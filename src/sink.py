@@ -0,0 +1,193 @@
+"""
+Write atomic (or merged) tables to Parquet, one dataset (directory of part files) per table tag.
+
+Tables can come in chunks (e.g. from 'stream.py'): each chunk is appended to its table's open part file
+as a row group, so no table is ever held in memory whole. A manifest lists the tags, their parent tags,
+row counts and part files. Needs pyarrow.
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import os
+import json
+import urllib.parse
+from typing import Union, List, Dict, Any, TypeVar, Iterable
+
+# data science
+try:  # optional dependency
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+import pandas as pd
+
+# module
+try:  # imported as part of the package
+    from . import breakdown
+except ImportError:  # imported with 'src/' on the path (e.g. tests)
+    import breakdown
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+ArrowTable = TypeVar("pa.Table")
+MANIFEST_NAME = "manifest.json"
+
+
+# converting tables
+def values_to_arrow(values: List[Any]) -> Any:
+    """
+    Convert a column's values to an arrow array.
+
+    Empty strings filling missing values of non-string columns become nulls, columns with only missing
+    values get the null type (typed once a chunk has values, see write_table_chunk()) and columns still
+    mixing types are written as strings.
+    """
+    if all(breakdown.is_null_value(value) or (isinstance(value, str) and value == "") for value in values):
+        return pa.nulls(len(values))
+    if any(not isinstance(value, str) and not breakdown.is_null_value(value) for value in values):
+        values = [None if isinstance(value, str) and value == "" else value
+                  for value in values]
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.array([None if breakdown.is_null_value(value) else str(value)
+                         for value in values], type=pa.string())
+
+
+def df_to_arrow(df: PandasDataFrame) -> ArrowTable:
+    """
+    Convert a table to an arrow table column by column.
+
+    Columns with pandas nullable dtypes (e.g. typed breakdowns' Int64) keep their type, with nulls.
+    """
+    return pa.table({col: pa.array(df[col], from_pandas=True) if is_nullable_column(df[col])
+                     else values_to_arrow(df[col].tolist()) for col in df.columns})
+
+
+def is_nullable_column(values: Any) -> bool:
+    """
+    Check if a column has one of pandas' nullable dtypes (Int64, Float64, boolean, string).
+    """
+    return pd.api.types.is_extension_array_dtype(values.dtype) and not isinstance(
+        values.dtype, pd.CategoricalDtype)
+
+
+def conform_table(table: ArrowTable, schema: Any) -> ArrowTable:
+    """
+    Give a table a (promoted) schema, adding its missing columns as nulls.
+    """
+    return pa.table({field.name: table.column(field.name).cast(field.type) if field.name in table.column_names
+                     else pa.nulls(table.num_rows, field.type) for field in schema}, schema=schema)
+
+
+def get_table_dir_name(tag: str) -> str:
+    """
+    Get a (reversible) file system safe directory name for a table tag.
+    """
+    return urllib.parse.quote(tag, safe="")
+
+
+# writing tables
+def write_table_chunk(table: ArrowTable,
+                      tag: str,
+                      out_dir: str,
+                      tag2writer: Dict[str, Any],
+                      tag2info: Dict[str, Dict[str, Any]],
+                      dtypes: Dict[str, str] = None):
+    """
+    Append a chunk of a table as a row group.
+
+    Chunks are conformed to the open part file's schema when it holds their types (e.g. a column of nulls).
+    Otherwise the schemas are promoted (e.g. a null column gets the chunk's type, ints become floats) and
+    a new part file is started; chunks whose types conflict with it (e.g. numbers and strings) start a new
+    part file with their own types, as values are never cast to strings. Nullable dtypes of the table
+    (dtypes, see df_to_arrow()) are kept in the manifest.
+    """
+    info = tag2info.setdefault(tag, {"parent": breakdown.get_parent_table_tag(tag),
+                                     "rows": 0,
+                                     "columns": list(),
+                                     "parts": list(),
+                                     "dtypes": dict()})
+    writer = tag2writer.get(tag)
+    if writer is not None:
+        try:
+            schema = pa.unify_schemas([writer.schema, table.schema], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            schema = table.schema
+        table = conform_table(table, schema)
+        if not schema.equals(writer.schema):
+            writer.close()
+            writer = None
+
+    if writer is None:
+        table_dir = os.path.join(out_dir, get_table_dir_name(tag))
+        os.makedirs(table_dir, exist_ok=True)
+        part = os.path.join(get_table_dir_name(tag),
+                            f"part-{len(info['parts']):05d}.parquet")
+        writer = tag2writer[tag] = pq.ParquetWriter(
+            os.path.join(out_dir, part), table.schema)
+        info["parts"].append(part)
+
+    writer.write_table(table)
+    info["rows"] += table.num_rows
+    info["columns"].extend([col for col in table.column_names
+                            if col not in info["columns"]])
+    for col, dtype in (dtypes or dict()).items():  # conflicting dtypes are left to pandas
+        info["dtypes"][col] = dtype if info["dtypes"].get(col, dtype) == dtype else None
+
+
+def write_parquet_tables(table_chunks: Union[Dict[str, PandasDataFrame],
+                                             Iterable[Dict[str, PandasDataFrame]]],
+                         out_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Write tables (or chunks of tables, e.g. stream.breakdown_ndjson()) to a Parquet dataset per table tag.
+
+    Returns the manifest (also written to the output directory) with each tag's parent tag, row count,
+    columns, part files and nullable dtypes.
+    """
+    if pa is None:
+        raise ImportError("writing Parquet needs pyarrow (pip install pyarrow)")
+    if isinstance(table_chunks, dict):
+        table_chunks = [table_chunks]
+
+    os.makedirs(out_dir, exist_ok=True)
+    tag2writer, tag2info = dict(), dict()
+    try:
+        for table_tag2df in table_chunks:
+            for tag, df in table_tag2df.items():
+                write_table_chunk(df_to_arrow(df), tag, out_dir, tag2writer, tag2info,
+                                  {col: str(df[col].dtype) for col in df.columns
+                                   if is_nullable_column(df[col])})
+    finally:
+        for writer in tag2writer.values():
+            writer.close()
+
+    manifest = {"tables": tag2info}
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+# reading tables
+def read_parquet_tables(out_dir: str, tags: List[str] = None) -> Dict[str, PandasDataFrame]:
+    """
+    Read tables written by write_parquet_tables() back into dataframes.
+    """
+    if pa is None:
+        raise ImportError("reading Parquet needs pyarrow (pip install pyarrow)")
+    with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+        tag2info = json.load(f)["tables"]
+
+    table_tag2df = dict()
+    for tag, info in tag2info.items():
+        if tags is None or tag in tags:
+            df = pd.concat([pq.read_table(os.path.join(out_dir, part)).to_pandas()
+                            for part in info["parts"]], ignore_index=True)[info["columns"]]
+            table_tag2df[tag] = df.astype({col: dtype for col, dtype in info.get("dtypes", dict()).items()
+                                           if dtype is not None})
+
+    return table_tag2df
@@ -0,0 +1,214 @@
+"""
+Breakdown streams of JSON records (newline-delimited files or huge top-level arrays) in bounded chunks
+using 'breakdown.py'.
+
+Keys keep counting across chunks, so the chunked atomic tables can be appended to each other (or written
+out). Each chunk is laid out on its own though: if records differ in shape, a column's table (e.g. a key
+that only holds arrays in some chunks), its dtype (e.g. ints in one chunk, floats next to missing values
+in another) and the order of tables/columns can depend on the chunk, unlike one breakdown of the whole
+stream.
+
+@author Samuel Zonay
+"""
+
+
+# standard
+import json
+import codecs
+import itertools
+from typing import Union, List, Dict, Any, TypeVar, Tuple, Iterable, Iterator, IO
+
+# module
+try:  # imported as part of the package
+    from . import breakdown, dedup
+except ImportError:  # imported with 'src/' on the path (e.g. tests)
+    import breakdown
+    import dedup
+
+
+# variables
+PandasDataFrame = TypeVar("pd.DataFrame")
+DEFAULT_CHUNK_SIZE = 10000  # records broken down at a time
+DEFAULT_BLOCK_SIZE = 1 << 16  # characters/bytes read from a file at a time
+WHITESPACE = " \t\r\n"  # skipped between top-level array elements
+
+
+# reading records
+def chunk_records(records: Iterable[Dict[str, Any]],
+                  chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Group records into lists of at most chunk_size records.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if len(chunk) == 0:
+            break
+        yield chunk
+
+
+def read_ndjson_chunks(source: Union[str, IO],
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Read newline-delimited JSON records from a file path or open (text/binary) file in chunks.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from read_ndjson_chunks(f, chunk_size)
+        return
+
+    yield from chunk_records((json.loads(line) for line in source if line.strip()),
+                             chunk_size)
+
+
+def read_into_buffer(source: IO,
+                     text_decoder: Union[codecs.IncrementalDecoder, None],
+                     buffer: str,
+                     pos: int,
+                     size: int) -> Tuple[str, int, bool]:
+    """
+    Drop the consumed part of the buffer and append the next block of the file.
+
+    Returns the new buffer, position and whether the end of the file was reached.
+    """
+    block = source.read(size)
+    text = block if text_decoder is None else text_decoder.decode(
+        block, final=len(block) == 0)
+
+    return buffer[pos:] + text, 0, len(block) == 0
+
+
+def iter_json_array(source: Union[str, IO],
+                    block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[Any]:
+    """
+    Parse the elements of a top-level JSON array one at a time from a file path or open (text/binary) file.
+
+    Only the current block of the file (or a single element, if larger) is held in memory.
+    A top-level value that isn't an array is yielded as a single element. Malformed arrays (e.g. truncated,
+    missing or extra commas, or anything but whitespace after the closing bracket) raise a JSONDecodeError.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from iter_json_array(f, block_size)
+        return
+
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")() if isinstance(
+        source.read(0), bytes) else None
+    json_decoder = json.JSONDecoder()
+    buffer, pos, eof, read_size = "", 0, False, block_size
+    opened, closed, expected = False, False, "value"
+    while True:
+        while pos < len(buffer) and buffer[pos] in WHITESPACE:
+            pos += 1
+
+        if pos == len(buffer):  # need more of the file
+            if eof and closed:
+                return
+            if eof:
+                raise json.JSONDecodeError(f"Expecting {expected}", buffer, pos)
+            buffer, pos, eof = read_into_buffer(
+                source, text_decoder, buffer, pos, read_size)
+            continue
+
+        if closed:  # only whitespace may follow the array
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+
+        if not opened:
+            if buffer[pos] != "[":  # not an array so parse the whole value
+                while not eof:
+                    buffer, pos, eof = read_into_buffer(
+                        source, text_decoder, buffer, pos, read_size)
+                yield json.loads(buffer[pos:])
+                return
+            opened, expected, pos = True, "value or ']'", pos + 1
+            continue
+
+        if expected == "',' or ']'":
+            if buffer[pos] not in ",]":
+                raise json.JSONDecodeError(f"Expecting {expected}", buffer, pos)
+            closed, expected, pos = buffer[pos] == "]", "value", pos + 1
+            continue
+
+        if buffer[pos] == "]" and expected == "value or ']'":
+            closed, pos = True, pos + 1
+            continue
+
+        # an element is only complete if whitespace, ',' or ']' follows it
+        # (numbers may otherwise continue in the next block)
+        try:
+            value, end = json_decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = None
+
+        if end is None or (not eof and (end == len(buffer)
+                                        or buffer[end] not in WHITESPACE + ",]")):
+            buffer, pos, eof = read_into_buffer(
+                source, text_decoder, buffer, pos, read_size)
+            read_size *= 2  # avoid reparsing large elements too many times
+            continue
+
+        yield value
+        pos, read_size, expected = end, block_size, "',' or ']'"
+
+
+def read_json_array_chunks(source: Union[str, IO],
+                           chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Read the records of a top-level JSON array from a file path or open (text/binary) file in chunks.
+    """
+    yield from chunk_records(iter_json_array(source, block_size), chunk_size)
+
+
+# streaming breakdown
+def stream_breakdown(chunks: Iterable[List[Dict[str, Any]]],
+                     endpoint_name: str = "root",
+                     drop_empty: bool = False,
+                     engine: str = "pandas",
+                     seen: Union[set, dedup.BloomFilter, dedup.DiskHashSet] = None) -> Iterator[Dict[str, PandasDataFrame]]:
+    """
+    Breakdown each chunk of records, yielding atomic tables with keys continuing over chunks.
+
+    Only one chunk (and its tables) is held at a time, and each chunk's tables are laid out from its own
+    records (see the module docstring on heterogeneous records). Given a seen-set (see 'dedup.py'),
+    records already seen (in this stream, or an earlier one sharing the seen-set) are dropped before being
+    broken down.
+    """
+    tag2offset = dict()
+    for chunk in chunks:
+        if seen is not None:
+            chunk = dedup.drop_seen_records(chunk, seen)
+            if len(chunk) == 0:
+                continue
+        table_tag2df = breakdown.breakdown_json(
+            chunk, endpoint_name, drop_empty, engine=engine)
+        yield breakdown.offset_table_keys(table_tag2df, tag2offset)
+
+
+def breakdown_ndjson(source: Union[str, IO],
+                     chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     endpoint_name: str = "root",
+                     drop_empty: bool = False,
+                     engine: str = "pandas",
+                     seen: Union[set, dedup.BloomFilter, dedup.DiskHashSet] = None) -> Iterator[Dict[str, PandasDataFrame]]:
+    """
+    Breakdown a newline-delimited JSON file chunk by chunk (memory depends on the chunk size only).
+    """
+    return stream_breakdown(read_ndjson_chunks(source, chunk_size),
+                            endpoint_name, drop_empty, engine, seen)
+
+
+def breakdown_json_array(source: Union[str, IO],
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         endpoint_name: str = "root",
+                         drop_empty: bool = False,
+                         engine: str = "pandas",
+                         block_size: int = DEFAULT_BLOCK_SIZE,
+                         seen: Union[set, dedup.BloomFilter, dedup.DiskHashSet] = None) -> Iterator[Dict[str, PandasDataFrame]]:
+    """
+    Breakdown a file holding a single top-level JSON array chunk by chunk (the array is never fully loaded).
+    """
+    return stream_breakdown(read_json_array_chunks(source, chunk_size, block_size),
+                            endpoint_name, drop_empty, engine, seen)
@@ -5,13 +5,19 @@ to run tests enter `pytest run.py [--disable-pytest-warnings]` in shell
 """
 
 # standard
+import io
 import sys
+import json
 import pytest
+import warnings
+import pandas as pd
 
 # module
 from mock_structures import *
 sys.path.append("../src/")
-import breakdown, merge
+import breakdown, merge, stream, plan, sink, dedup, profiler
+sys.path.append("../benchmarks/")
+import generate
 
 
 # fixtures
@@ -134,4 +140,458 @@ def test_duplicated(duplicated):
 def test_merge(complex2_):
     tag2df = breakdown.breakdown_json(complex2_.json)
     merged_tag2df = merge.merge_tables(tag2df)
-    assert_over_tag2df(merged_tag2df, complex2_, merged=True)
\ No newline at end of file
+    assert_over_tag2df(merged_tag2df, complex2_, merged=True)
+
+def test_tag_index(complex2_, capsys):
+    tag2df = breakdown.breakdown_json(complex2_.json)
+    tag_index = merge.build_tag_index(tag2df)
+    tag = "root_0<people_1<interests_2"
+    assert(tag_index["root_0<people_1"]["children"] == [tag])
+    assert(tag_index[tag]["name"] == "interests" and tag_index[tag]["level"] == 2)
+    assert(merge.get_chain_tags(tag, tag_index) == ["root_0", "root_0<people_1", tag])
+    assert(merge.get_tags_by_level(tag_index) == [tag, "root_0<animals_1", "root_0<people_1"])
+
+    merged_tag2df = merge.merge_tables(tag2df, verbose=False)
+    assert(capsys.readouterr().out == "")
+    assert_over_tag2df(merged_tag2df, complex2_, merged=True)
+
+
+def test_parallel_merge(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json)
+    merged_tag2df = merge.merge_tables(tag2df, verbose=False, workers=2)
+    assert(list(merged_tag2df) == list(merge.merge_tables(tag2df, verbose=False)))
+    assert_over_tag2df(merged_tag2df, complex2_, merged=True)
+
+
+def test_explain_merge(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json)
+    explained_df = merge.explain_merge(tag2df)
+    merged_tag2df = merge.merge_tables(tag2df, verbose=False)
+    assert(list(explained_df.index) == list(merged_tag2df))
+    assert(explained_df["rows"].tolist() == [len(df) for df in merged_tag2df.values()])
+    assert((explained_df["est_bytes"] > 0).all())
+
+    max_rows = explained_df["rows"].min()
+    assert(list(merge.merge_tables(tag2df, verbose=False, max_rows=max_rows)) ==
+           list(explained_df.index[explained_df["rows"] <= max_rows]))
+
+
+def test_iter_merge_tag_chain(complex2_, tmp_path):
+    tag2df = breakdown.breakdown_json(complex2_.json)
+    tag = "root_0<people_1<interests_2"
+    chunks = list(merge.iter_merge_tag_chain(tag, tag2df, chunk_rows=4))
+    assert(len(chunks) > 1 and all(len(chunk) <= 6 for chunk in chunks))
+    assert(pd.concat(chunks).to_dict() == complex2_.merged[tag])
+
+    merged_tag2df = merge.merge_tables(tag2df, verbose=False, max_rows=4, over_max_rows="stream")
+    assert(set(merged_tag2df) == set(complex2_.merged))
+    assert(merged_tag2df["root_0<animals_1"].to_dict() == complex2_.merged["root_0<animals_1"])
+    sink.write_parquet_tables(({tag: chunk} for chunk in merged_tag2df[tag]), str(tmp_path / "out"))
+    assert(len(sink.read_parquet_tables(str(tmp_path / "out"))[tag]) == len(complex2_.merged[tag]["people.name"]))
+
+
+def test_merge_dense_level_pair():
+    parent_df = pd.DataFrame({"PK": [1.0, None, 0.0], "a": ["x", "y", "z"]})
+    child_df = pd.DataFrame({"PK": [0, 1, 2], "FK": [0, 1, 0], "b": [1, 2, 3]})
+    merged_df = merge.merge_dense_level_pair(parent_df, child_df)
+    assert(merged_df.equals(parent_df.merge(child_df, left_on="PK", right_on="FK", how="left")))
+    assert(merge.merge_dense_level_pair(parent_df.assign(PK=[1.0, None, 5.0]), child_df) is None)
+
+
+def test_no_serialization_round_trip():
+    data = [{"a": {"b": 0.12345678901234567, 1: "x"},
+             "c": [{"d": 0.12345678901234567, 2: "y"}]}]
+    tag2df = breakdown.breakdown_json(data)
+    assert(tag2df["root_0"]["root.a_b"][0] == 0.12345678901234567)
+    assert(tag2df["root_0"]["root.a_1"][0] == "x")
+    assert(tag2df["root_0<c_1"]["c.d"][0] == 0.12345678901234567)
+    assert(tag2df["root_0<c_1"]["c.2"][0] == "y")
+
+    # missing values in arrays don't change the key dtypes
+    tag2df = breakdown.breakdown_json([{"z": [{"b": [float("nan"), None]}]}])
+    assert(str(tag2df["root_0<z_1<b_2"]["FK"].dtype) == "int64")
+
+
+def test_type_census():
+    codes, type2idxs = breakdown.take_type_census([1, "a", 2, None, {"b": 1}])
+    assert(codes.tolist() == [0, 1, 0, 2, 3])
+    assert({type_: idxs.tolist() for type_, idxs in type2idxs.items()} ==
+           {"<class 'int'>": [0, 2], "<class 'str'>": [1],
+            "<class 'NoneType'>": [3], "<class 'dict'>": [4]})
+
+
+# engines
+MOCK_STRUCTURES = [NestedObject, NestedObjectMultipleTypes, SimpleArray, NestedArray,
+                   ObjectsInArrays, ArraysInObjects, ArrayLeadingDiffers, Complex,
+                   Complex2, Duplicated]
+
+
+@pytest.mark.parametrize("structure", MOCK_STRUCTURES)
+def test_native_engine(structure):
+    object_ = structure()
+    tag2df = breakdown.breakdown_json(object_.json, engine="native")
+    assert(list(tag2df) == list(breakdown.breakdown_json(object_.json)))
+    assert_over_tag2df(tag2df, object_)
+
+
+@pytest.mark.parametrize("structure", MOCK_STRUCTURES)
+def test_arrow_engine(structure):
+    pytest.importorskip("pyarrow")
+    object_ = structure()
+    tag2df = breakdown.breakdown_json(object_.json, engine="arrow")
+    assert(list(tag2df) == list(breakdown.breakdown_json(object_.json)))
+    assert_over_tag2df(tag2df, object_)
+
+
+@pytest.mark.parametrize("data", [
+    [{"id": 1, "meta": {"source": "web", "geo": {"lat": 1.5}}}, {"id": 2, "meta": {"source": "app", "geo": {"lat": 2.5}}}],
+    [{"id": 1, "people": [{"name": "a", "phones": ["1", "2"]}], "grid": [[1, 2], [3]]},
+     {"id": 2, "people": [{"name": "b", "phones": ["3"]}], "grid": [[4]]}]])
+def test_arrow_engine_runs(data):
+    pytest.importorskip("pyarrow")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", breakdown.EngineFallbackWarning)
+        tag2df = breakdown.arrow_breakdown_json(data, "root", False)
+    native_tag2df = breakdown.breakdown_json(data, engine="native")
+    assert(list(tag2df) == list(native_tag2df))
+    for tag, df in native_tag2df.items():
+        assert(tag2df[tag].to_dict() == df.to_dict())
+
+
+def test_arrow_engine_fallback(complex2_):
+    pytest.importorskip("pyarrow")
+    with pytest.warns(breakdown.EngineFallbackWarning):  # mixes objects and simple values in arrays
+        breakdown.breakdown_json(complex2_.json, engine="arrow")
+    with pytest.warns(breakdown.EngineFallbackWarning):
+        breakdown.breakdown_json(complex2_.json, engine="arrow", typed=True)
+
+
+def test_native_engine_merge(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json, engine="native")
+    merged_tag2df = merge.merge_tables(tag2df)
+    assert_over_tag2df(merged_tag2df, complex2_, merged=True)
+
+
+# lazy
+def test_lazy_breakdown(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json, lazy=True)
+    assert(len(tag2df.table_tag2df) == 0)
+
+    tag = "root_0<people_1<interests_2"
+    assert(tag2df[tag].to_dict() == complex2_.expected[tag])
+    assert(list(tag2df.table_tag2df) == ["root_0", "root_0<people_1", tag])
+    assert(list(tag2df.table_tag2buffers) == ["root_0<animals_1"])  # kept from walking the root once
+    assert(list(tag2df) == list(complex2_.expected))
+    assert_over_tag2df(dict(tag2df), complex2_)
+
+
+# projection
+def test_path_projection(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json, exclude_paths=["root_0<people_1"])
+    assert(list(tag2df) == ["root_0", "root_0<animals_1"])
+    assert_over_tag2df(tag2df, complex2_)
+
+    tag2df = breakdown.breakdown_json(complex2_.json, include_paths=["root_0<people_1.name"],
+                                      exclude_paths=["root_0.other"])
+    assert(list(tag2df) == ["root_0", "root_0<people_1"])
+    assert(list(tag2df["root_0"]) == ["PK", "root.date", "root.user_id"])
+    assert(list(tag2df["root_0<people_1"]) == ["PK", "FK", "people.subarray_IDX", "people.name"])
+
+    with pytest.raises(ValueError):
+        breakdown.breakdown_json(complex2_.json, include_paths=["root_0<people"])
+
+
+@pytest.mark.parametrize("workers,lazy", [(1, False), (2, False), (1, True)])
+def test_path_projection_key_names(workers, lazy, monkeypatch):
+    monkeypatch.setattr(breakdown, "MAX_SHAPE_RECORD_SHARE", float("inf"))
+    # keys ending in '_<n>' or holding '.' are columns/tables, not table tags
+    data = [{"id": 1, "address_0": "x", "people": [{"name": "a", "phone_1": "555"}]},
+            {"id": 2, "address_0": "y", "child.x": {"items": [{"a": 1}]}, "child": {"items": [{"b": 2}]}}]
+
+    tag2df = breakdown.breakdown_json(data, workers=workers, lazy=lazy, include_paths=["root_0<people_1.phone_1"])
+    assert(list(tag2df) == ["root_0", "root_0<people_1"])
+    assert(list(tag2df["root_0<people_1"]) == ["PK", "FK", "people.subarray_IDX", "people.phone_1"])
+
+    tag2df = breakdown.breakdown_json(data, workers=workers, lazy=lazy,
+                                      exclude_paths=["root_0.address_0", "root_0<people_1.phone_1"])
+    assert("root.address_0" not in list(tag2df["root_0"]))
+    assert(list(tag2df["root_0<people_1"]) == ["PK", "FK", "people.subarray_IDX", "people.name"])
+
+    tag2df = breakdown.breakdown_json(data, workers=workers, lazy=lazy, include_paths=["root_0<child.items_1.b"])
+    assert(list(tag2df) == ["root_0", "root_0<child.items_1"])
+    assert(list(tag2df["root_0<child.items_1"]) == ["PK", "FK", "child.items.subarray_IDX", "child.items.b"])
+
+    tag2df = breakdown.breakdown_json(data, workers=workers, lazy=lazy, exclude_paths=["root_0<child.x.items_1"])
+    assert(list(tag2df) == ["root_0", "root_0<people_1", "root_0<child.items_1"])
+
+    for paths in [["root_0.address"], ["root_0<people_1.phone"], ["root_0<child_1"]]:
+        with pytest.raises(ValueError):
+            breakdown.breakdown_json(data, workers=workers, lazy=lazy, exclude_paths=paths)
+
+
+# compact output
+def test_compact_tables(complex2_):
+    tag2df = breakdown.breakdown_json(complex2_.json, compact=True)
+    interests_df = tag2df["root_0<people_1<interests_2"]
+    assert(all(str(df[col].dtype) == "uint8" for df in tag2df.values()
+               for col in df if breakdown.is_key_column(col)))
+    assert(str(interests_df["interests.interests_geetar_type"].dtype) == "category")
+    assert(str(interests_df["interests.interests"].dtype) == "object")
+    assert_over_tag2df({tag: df.astype(object) for tag, df in tag2df.items()}, complex2_)
+
+
+# typed output
+def test_typed_tables(monkeypatch):
+    monkeypatch.setattr(breakdown, "MAX_SHAPE_RECORD_SHARE", float("inf"))
+    data = [{"n": 1, "a": [{"x": 1.5, "flag": True}, {"s": "y"}]}, {"n": None, "a": [{"flag": None}]}]
+    tag2df = breakdown.breakdown_json(data, typed=True)
+    root_df, a_df = tag2df["root_0"], tag2df["root_0<a_1"]
+    assert(str(root_df["root.n"].dtype) == "Int64")
+    assert(root_df["root.n"].isna().tolist() == [False, True])
+    assert([str(a_df[col].dtype) for col in ["a.x", "a.flag", "a.s"]] == ["Float64", "boolean", "string"])
+    assert(a_df["a.flag"].isna().tolist() == [False, True, True])
+    assert(list(breakdown.breakdown_json(data, typed=True, workers=2)) == list(tag2df))
+
+
+# streaming
+def test_breakdown_ndjson(complex2_, tmp_path):
+    path = tmp_path / "complex2.ndjson"
+    path.write_text("\n".join(json.dumps(record) for record in complex2_.json))
+    tag2df = breakdown.concat_table_chunks(
+        stream.breakdown_ndjson(str(path), chunk_size=1))
+    assert_over_tag2df(tag2df, complex2_)
+
+
+def test_duplicated_rows():
+    # objects with mixed key types are left in cells of arrays that start with a simple value
+    assert(dedup.hash_record({1: "a", "b": [{2: 3, "c": 4}]}) == dedup.hash_record({"b": [{"c": 4, 2: 3}], 1: "a"}))
+    assert(dedup.hash_record({1: "a"}) != dedup.hash_record({1: "b"}))
+
+    assert(not dedup.get_duplicated_rows(pd.DataFrame({"PK": [0, 1], "a": [[1], [1]]}), ["PK"]).any())
+    hashes = dedup.hash_rows(pd.DataFrame({"a": [[1], [1], {"b": 1}]}))
+    assert(str(hashes.dtype) == "uint64" and hashes[0] == hashes[1] != hashes[2])
+
+    df = pd.DataFrame({"root_0_PK": [0, 1, 0, 1, 0],
+                       "a": [{1: "x", "y": 2}, "z", {"y": 2, 1: "x"}, "z", {1: "x"}]})
+    df = breakdown.process_final_table(df, "root_0_PK", "root_0")
+    assert(df["PK"].tolist() == [0, 1, 0])
+    assert(df["root.a"].tolist() == [{1: "x", "y": 2}, "z", {1: "x"}])
+
+
+@pytest.mark.parametrize("seen_kind", ["set", "bloom", "disk"])
+def test_breakdown_ndjson_seen(complex2_, tmp_path, seen_kind):
+    path = tmp_path / "complex2.ndjson"
+    path.write_text("\n".join(json.dumps(record) for record in complex2_.json * 2))
+    seen = {"set": set(),
+            "bloom": dedup.BloomFilter(1000, 0.001, str(tmp_path / "seen.bloom")),
+            "disk": dedup.DiskHashSet(str(tmp_path / "seen.db"))}[seen_kind]
+    tag2df = breakdown.concat_table_chunks(
+        stream.breakdown_ndjson(str(path), chunk_size=1, seen=seen))
+    assert_over_tag2df(tag2df, complex2_)
+    assert(list(stream.breakdown_ndjson(str(path), seen=seen)) == [])
+
+
+def test_iter_json_array():
+    data = [1, 23.5, "a]\\\"", {"b": [1, {"c": None}]}, None, True]
+    source = io.BytesIO(json.dumps(data).encode("utf-8"))
+    assert(list(stream.iter_json_array(source, block_size=2)) == data)
+
+    for text in ["[1, 2", "[1 2]", "[1,, 2]", "[1,]", "[1]x", "[1] [2]", ""]:
+        with pytest.raises(json.JSONDecodeError):
+            list(stream.iter_json_array(io.StringIO(text), block_size=2))
+    assert(list(stream.iter_json_array(io.StringIO(" [ ] \n"))) == [])
+
+
+def test_breakdown_json_array(complex2_, tmp_path):
+    path = tmp_path / "complex2.json"
+    path.write_text(json.dumps(complex2_.json, indent=4))
+    tag2df = breakdown.concat_table_chunks(
+        stream.breakdown_json_array(str(path), chunk_size=1, block_size=16))
+    assert_over_tag2df(tag2df, complex2_)
+
+
+# parquet
+def test_write_parquet_tables(complex2_, tmp_path):
+    path = tmp_path / "complex2.ndjson"
+    path.write_text("\n".join(json.dumps(record) for record in complex2_.json))
+    manifest = sink.write_parquet_tables(
+        stream.breakdown_ndjson(str(path), chunk_size=1), str(tmp_path / "out"))
+
+    tag2df = breakdown.breakdown_json(complex2_.json)
+    parquet_tag2df = sink.read_parquet_tables(str(tmp_path / "out"))
+    assert(list(manifest["tables"]) == list(tag2df))
+    for tag, df in tag2df.items():
+        assert(manifest["tables"][tag]["rows"] == len(df))
+        assert(manifest["tables"][tag]["parent"] == breakdown.get_parent_table_tag(tag))
+        assert(list(parquet_tag2df[tag].columns) == list(df.columns))
+        assert(parquet_tag2df[tag]["PK"].tolist() == df["PK"].tolist())
+
+
+def test_write_parquet_schema_changes(tmp_path):
+    # a column missing from the first chunk is typed by the later ones (never cast to strings)
+    chunks = [{"t": pd.DataFrame({"PK": [0, 1], "a": ["", ""]})},
+              {"t": pd.DataFrame({"PK": [2, 3], "a": [5, 7]})},
+              {"t": pd.DataFrame({"PK": [4], "a": ["x"]})}]
+    sink.write_parquet_tables(chunks, str(tmp_path / "chunks"))
+    assert(sink.read_parquet_tables(str(tmp_path / "chunks"))["t"]["a"].tolist() == [None, None, 5, 7, "x"])
+
+    tag2df = breakdown.breakdown_json([{"n": 1, "s": "a"}, {"n": None}], typed=True)
+    sink.write_parquet_tables(tag2df, str(tmp_path / "typed"))
+    pd.testing.assert_frame_equal(sink.read_parquet_tables(str(tmp_path / "typed"))["root_0"], tag2df["root_0"])
+
+
+# parallel
+def test_parallel_breakdown(complex2_, monkeypatch):
+    monkeypatch.setattr(breakdown, "MAX_SHAPE_RECORD_SHARE", float("inf"))  # (every record shows a new shape)
+    tag2df = breakdown.breakdown_json(complex2_.json, workers=2)
+    assert(list(tag2df) == list(breakdown.breakdown_json(complex2_.json)))
+    assert_over_tag2df(tag2df, complex2_)
+
+
+def test_parallel_breakdown_differing_shards(monkeypatch):
+    monkeypatch.setattr(breakdown, "MAX_SHAPE_RECORD_SHARE", float("inf"))
+    # 'c' is only an object in the first shard and 'n' only missing in the second
+    data = [{"id": 1, "c": [{"x": 1}], "n": 2},
+            {"id": 2, "c": {"x": 2}, "n": 3},
+            {"id": 3, "c": [{"x": 3}, {"y": "a"}], "n": None},
+            {"id": 4, "c": {"x": 4, "z": [1, 2]}, "tags": ["a", "b"]}]
+    tag2df = breakdown.breakdown_json(data, engine="native")  # (the pandas engine can't mix objects/arrays)
+    parallel_tag2df = breakdown.breakdown_json(data, workers=2)
+    assert(list(parallel_tag2df) == list(tag2df))
+    for tag, df in tag2df.items():
+        pd.testing.assert_frame_equal(parallel_tag2df[tag], df)
+        assert(parallel_tag2df[tag].astype(str).equals(df.astype(str)))  # e.g. 2 isn't cast to 2.0
+
+
+def test_parallel_breakdown_shape_fallback(monkeypatch):
+    # records keyed by ids all show new shapes, so they're broken down serially
+    def walk_shard_tables(*args, **kwargs):
+        raise AssertionError("shards walked")
+    monkeypatch.setattr(breakdown, "walk_shard_tables", walk_shard_tables)
+    data = [{"users": {f"u{i}": {"n": i}}} for i in range(20)]
+    tag2df = breakdown.breakdown_json(data, workers=2)
+    pd.testing.assert_frame_equal(tag2df["root_0"], breakdown.breakdown_json(data, engine="native")["root_0"])
+
+
+# plans
+def test_breakdown_plan(complex2_, tmp_path):
+    path = str(tmp_path / "plan.json")
+    plan.save_breakdown_plan(
+        plan.compile_breakdown_plan(complex2_.json), path)
+    compiled_plan = plan.load_breakdown_plan(path)
+
+    tag2df, unseen_paths = plan.execute_breakdown_plan(
+        complex2_.json, compiled_plan)
+    assert_over_tag2df(tag2df, complex2_)
+    assert(unseen_paths == [])
+
+    _, unseen_paths = plan.execute_breakdown_plan(
+        complex2_.json + [{"new": {"path": [1]}}], compiled_plan)
+    assert(("root_0", "new") in unseen_paths)
+    assert(("root_0", "new.path") in unseen_paths)
+    assert(not any(col in ["FK", "subarray_IDX"] for _, col in unseen_paths))
+
+
+def test_breakdown_plan_drift():
+    compiled_plan = plan.compile_breakdown_plan(
+        [{"id": 1, "tags": "a", "meta": "x", "people": [{"name": "a", "phone": "1"}]}])
+    data = [{"id": 2, "tags": ["b", "c"], "meta": {"source": "web"}, "people": [{"name": "b", "phone": ["2", "3"]}]},
+            {"id": 3, "tags": "d", "meta": "y", "people": []}]
+
+    # planned leaves aren't checked by default
+    tag2df, unseen_paths = plan.execute_breakdown_plan(data, compiled_plan)
+    assert(list(tag2df) == ["root_0", "root_0<people_1"] and unseen_paths == [])
+
+    tag2df, unseen_paths = plan.execute_breakdown_plan(data, compiled_plan, check_leaves=True)
+    fresh_tag2df = breakdown.breakdown_json(data, engine="native")
+    assert(sorted(tag2df) == sorted(fresh_tag2df))
+    for tag, df in fresh_tag2df.items():
+        pd.testing.assert_frame_equal(tag2df[tag], df)
+    for path in [("root_0", "tags"), ("root_0", "meta"), ("root_0<people_1", "phone")]:
+        assert(path in unseen_paths)
+
+
+# profiling
+def test_schema_profile():
+    data = [{"id": i, "name": f"n{i % 3}", "tags": [i, None], "info": {"score": i / 2}} for i in range(200)]
+    data.append({"id": None, "tags": []})
+    summary = profiler.profile_records(data, n_examples=4).summary()
+    assert(list(summary.index) == ["id", "name", "tags", "tags[]", "info", "info.score"])
+    assert(summary.loc["id", "count"] == 201)
+    assert(summary.loc["id", "types"] == {"int": 200, "null": 1})
+    assert(summary.loc["tags[]", "null_rate"] == 0.5)
+    assert(summary.loc["name", "distinct"] == 3)
+    assert(abs(summary.loc["id", "distinct"] - 200) <= 10)
+    assert((summary.loc["info.score", "min"], summary.loc["info.score", "max"]) == (0, 99.5))
+    assert(summary.loc["name", "min"] == "n0")
+    assert(len(summary.loc["id", "examples"]) == 4)
+
+
+def test_merge_schema_profiles(complex2_, tmp_path):
+    for i, record in enumerate(complex2_.json):
+        (tmp_path / f"{i}.json").write_text(json.dumps(record))
+    whole_profile = profiler.profile_records(complex2_.json)
+    profile = profiler.profile_directory(str(tmp_path), workers=2)
+    assert(profile.n_records == len(complex2_.json))
+    columns = ["count", "null_rate", "types", "distinct", "min", "max"]
+    assert(profile.summary()[columns].sort_index().equals(whole_profile.summary()[columns].sort_index()))
+    assert(profile.key_tree() == whole_profile.key_tree())
+    with pytest.raises(ValueError):
+        profile.merge(profiler.SchemaProfile(hll_precision=4))
+
+    # merging into a new profile leaves both inputs as they were
+    first_profile, second_profile = (profiler.profile_records(complex2_.json[:1]),
+                                     profiler.profile_records(complex2_.json[1:]))
+    first_summary = first_profile.summary()
+    merged_summary = first_profile.merge(second_profile).summary()
+    assert(merged_summary[columns].sort_index().equals(whole_profile.summary()[columns].sort_index()))
+    assert(first_profile.summary()[columns].equals(first_summary[columns]))
+
+    # json arrays are read one record at a time
+    (tmp_path / "all.json").write_text(json.dumps(complex2_.json))
+    records = profiler.read_records(str(tmp_path / "all.json"))
+    assert(not isinstance(records, list) and list(records) == complex2_.json)
+
+
+def test_profile_cache(complex2_, tmp_path):
+    (tmp_path / "data").mkdir()
+    for i, record in enumerate(complex2_.json):
+        (tmp_path / "data" / f"{i}.json").write_text(json.dumps(record))
+    cache = profiler.ProfileCache(str(tmp_path / "profiles.db"), hash_content=True)
+    profile = profiler.profile_directory(str(tmp_path / "data"), cache=cache)
+    assert(profiler.profile_directory(str(tmp_path / "data"), cache=cache).key_tree() == profile.key_tree())
+
+    path = str(tmp_path / "data" / "0.json")
+    fingerprint = cache.get_fingerprint(path, profiler.DEFAULT_N_EXAMPLES, profiler.DEFAULT_HLL_PRECISION)
+    assert(cache.get(path, fingerprint).n_records == 1)
+    (tmp_path / "data" / "0.json").write_text(json.dumps([{"new": 1}, {"new": 2}]))
+    assert(profiler.profile_directory(str(tmp_path / "data"), cache=cache).n_records == len(complex2_.json) + 1)
+
+    small_cache = profiler.ProfileCache(str(tmp_path / "profiles.db"), max_bytes=0)
+    small_cache.flush()
+    assert(small_cache.connection.execute("SELECT COUNT(*) FROM profiles").fetchone()[0] == 0)
+
+
+# benchmarks
+def test_generate_records():
+    records = generate.generate_records(50, depth=2, fanout=2, width=3, heterogeneity=0.5, duplicate_rate=0.5)
+    assert(records == generate.generate_records(50, depth=2, fanout=2, width=3, heterogeneity=0.5,
+                                                duplicate_rate=0.5))
+    assert(len({json.dumps(record) for record in records}) < len(records))
+    tag2df = breakdown.breakdown_json(records)
+    assert(len(tag2df["root_0"]) == len(records))
+    assert("root_0<mixed_1" in tag2df and "root_0<items_1<items.items_2" in tag2df)
+    assert(len(merge.merge_tables(tag2df, verbose=False)) > 0)
+
+
+@pytest.mark.parametrize("heterogeneity", [0.05, 0.1, 0.3, 0.5, 1.0])
+def test_generate_records_heterogeneity(heterogeneity):
+    for seed in range(4):
+        for fanout, width in [(2, 4), (3, 8)]:
+            records = generate.generate_records(20, fanout=fanout, width=width, heterogeneity=heterogeneity,
+                                                seed=seed)
+            items = [item for record in records for item in record["items"]]
+            n_simple_items = len([item for item in items if not isinstance(item, dict)])
+            assert(0 < n_simple_items and abs(n_simple_items / len(items) - heterogeneity) < 0.1)
+            assert(list(breakdown.breakdown_json(records)) == list(breakdown.breakdown_json(records,
+                                                                                            engine="native")))